@@ -0,0 +1,89 @@
+"""Create the DynamoDB tables and global secondary indexes the query planner expects.
+
+Reads the index registry in `backend/dynamodb_client.py` (COLLECTION_INDEXES). Missing
+tables are created on-demand (PAY_PER_REQUEST) with their indexes; existing tables get
+any missing index added, one at a time as DynamoDB requires, waiting for each to become
+ACTIVE. Safe to re-run.
+
+    python -m backend.create_dynamo_indexes [collection ...]
+"""
+import sys
+import time
+import boto3
+from dotenv import load_dotenv
+load_dotenv()
+
+from backend.dynamodb_client import COLLECTION_INDEXES, REGION
+
+
+def _gsi(attr: str, index_name: str, billing: dict) -> dict:
+    index = {
+        'IndexName': index_name,
+        'KeySchema': [{'AttributeName': attr, 'KeyType': 'HASH'}],
+        'Projection': {'ProjectionType': 'ALL'},
+    }
+    throughput = billing.get('ProvisionedThroughput')
+    if throughput:
+        index['ProvisionedThroughput'] = {
+            'ReadCapacityUnits': throughput['ReadCapacityUnits'],
+            'WriteCapacityUnits': throughput['WriteCapacityUnits'],
+        }
+    return index
+
+
+def _wait_for_index(dynamo, table_name: str, index_name: str):
+    while True:
+        table = dynamo.describe_table(TableName=table_name)['Table']
+        status = next((i['IndexStatus'] for i in table.get('GlobalSecondaryIndexes', [])
+                       if i['IndexName'] == index_name), None)
+        if status == 'ACTIVE':
+            return
+        print(f"  waiting for {table_name}.{index_name} ({status})")
+        time.sleep(10)
+
+
+def ensure_collection(dynamo, table_name: str, indexes: dict):
+    try:
+        table = dynamo.describe_table(TableName=table_name)['Table']
+    except dynamo.exceptions.ResourceNotFoundException:
+        print(f"Creating table {table_name} with indexes {sorted(indexes.values())}")
+        attrs = ['_id', *indexes]
+        kwargs = dict(
+            TableName=table_name,
+            KeySchema=[{'AttributeName': '_id', 'KeyType': 'HASH'}],
+            AttributeDefinitions=[{'AttributeName': a, 'AttributeType': 'S'} for a in attrs],
+            BillingMode='PAY_PER_REQUEST',
+        )
+        if indexes:
+            kwargs['GlobalSecondaryIndexes'] = [_gsi(a, n, {}) for a, n in indexes.items()]
+        dynamo.create_table(**kwargs)
+        dynamo.get_waiter('table_exists').wait(TableName=table_name)
+        for index_name in indexes.values():
+            _wait_for_index(dynamo, table_name, index_name)
+        return
+
+    existing = {i['IndexName'] for i in table.get('GlobalSecondaryIndexes', [])}
+    billing = {}
+    if table.get('BillingModeSummary', {}).get('BillingMode') != 'PAY_PER_REQUEST':
+        billing['ProvisionedThroughput'] = table['ProvisionedThroughput']
+    for attr, index_name in indexes.items():
+        if index_name in existing:
+            print(f"{table_name}.{index_name} exists")
+            continue
+        print(f"Creating index {table_name}.{index_name} on {attr}")
+        dynamo.update_table(
+            TableName=table_name,
+            AttributeDefinitions=[{'AttributeName': attr, 'AttributeType': 'S'}],
+            GlobalSecondaryIndexUpdates=[{'Create': _gsi(attr, index_name, billing)}],
+        )
+        _wait_for_index(dynamo, table_name, index_name)
+
+
+def main(collections=None):
+    dynamo = boto3.client('dynamodb', region_name=REGION)
+    for name in collections or COLLECTION_INDEXES:
+        ensure_collection(dynamo, name, COLLECTION_INDEXES.get(name, {}))
+
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
@@ -1,186 +1,477 @@
 import os
+import json
 import uuid
+import base64
+import logging
 import aioboto3
 import asyncio
+import threading
+from contextlib import AsyncExitStack
 from datetime import datetime, date
-from typing import Any, Dict, AsyncIterator, Optional
+from typing import Any, Dict, AsyncIterator, List, Optional, Sequence, Tuple
 from boto3.dynamodb.conditions import Attr, Key
+from botocore.config import Config
+from botocore.exceptions import ClientError
 
 REGION = os.getenv("AWS_REGION", "us-east-1")
+# HTTP connections kept open by the shared DynamoDB resource of each event loop.
+DYNAMODB_MAX_POOL_CONNECTIONS = int(os.getenv("DYNAMODB_MAX_POOL_CONNECTIONS", "50"))
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Items per BatchWriteItem / BatchGetItem request (DynamoDB limits).
+BATCH_WRITE_SIZE = 25
+BATCH_GET_SIZE = 100
+# Batch requests of one insert_many / find_many_by_ids call in flight at once.
+DYNAMODB_BATCH_CONCURRENCY = int(os.getenv("DYNAMODB_BATCH_CONCURRENCY", "8"))
+# Attempts for items DynamoDB returns unprocessed (throttling), with exponentially growing
+# delays starting at the backoff.
+DYNAMODB_BATCH_MAX_ATTEMPTS = int(os.getenv("DYNAMODB_BATCH_MAX_ATTEMPTS", "8"))
+DYNAMODB_BATCH_BACKOFF_SECONDS = float(os.getenv("DYNAMODB_BATCH_BACKOFF_SECONDS", "0.05"))
+
+# Global secondary indexes per collection, as filter attribute -> index name. Each index
+# has the attribute as its partition key and projects all attributes. Equality filters on
+# these attributes are served by Query instead of a table scan; create the indexes with
+# `python -m backend.create_dynamo_indexes`.
+COLLECTION_INDEXES: Dict[str, Dict[str, str]] = {
+    "users": {"email": "email-index"},
+    "documents": {"user_id": "user_id-index", "s3_key": "s3_key-index"},
+    "generated_content": {"document_id": "document_id-index"},
+    "content_hashes": {},
+    "upload_batches": {},
+}
+
+
+def encode_cursor(key: Dict[str, Any]) -> str:
+    """Opaque, URL-safe cursor for a DynamoDB LastEvaluatedKey."""
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":"), default=str).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        key = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(key, dict):
+        raise ValueError("Invalid cursor")
+    return key
+
+
+def _serialize(obj):
+    # Convert datetimes, UUIDs and nested structures into Dynamo-friendly types
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, uuid.UUID):
+        return str(obj)
+    if isinstance(obj, dict):
+        return {k: _serialize(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_serialize(v) for v in obj]
+    return obj
+
+
+def _projection(fields: Sequence[str]) -> Dict[str, Any]:
+    names = {f"#p{i}": f for i, f in enumerate(dict.fromkeys(fields))}
+    return {'ProjectionExpression': ", ".join(names), 'ExpressionAttributeNames': names}
+
+
+async def _bounded_gather(coros: List[Any], limit: int = DYNAMODB_BATCH_CONCURRENCY) -> List[Any]:
+    semaphore = asyncio.Semaphore(limit)
+
+    async def run(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*(run(c) for c in coros))
+
+
+def _equals(filter: Dict[str, Any]):
+    expr = None
+    for k, v in filter.items():
+        cond = Attr(k).eq(v)
+        expr = cond if expr is None else (expr & cond)
+    return expr
+
+
+class _UpdateResult:
+    def __init__(self, matched_count: int, document: Optional[Dict[str, Any]]):
+        self.matched_count = matched_count
+        self.modified_count = matched_count
+        self.document = document
+
+    def __repr__(self):
+        return f"UpdateResult(matched_count={self.matched_count})"
 
 
 class DynamoCollection:
-    def __init__(self, table_name: str):
+    def __init__(self, table_name: str, client: "DynamoDBClient"):
         self.table_name = table_name
-    # Note: we intentionally avoid a shared long-lived resource. Each method
-    # opens an async resource context and fetches the table. Some versions of
-    # aioboto3 return coroutine-like table proxies, so we normalize by awaiting
-    # them when needed.
+        self._client = client
+
+    async def _table(self):
+        return await self._client.table(self.table_name)
 
     async def insert_one(self, doc: Dict[str, Any]) -> Any:
         # Ensure string _id exists (to mimic Mongo ObjectId behavior)
         if '_id' not in doc:
             doc['_id'] = str(uuid.uuid4())
 
-        def _serialize(obj):
-            # Convert datetimes, UUIDs and nested structures into Dynamo-friendly types
-            if isinstance(obj, (datetime, date)):
-                return obj.isoformat()
-            if isinstance(obj, uuid.UUID):
-                return str(obj)
-            if isinstance(obj, dict):
-                return {k: _serialize(v) for k, v in obj.items()}
-            if isinstance(obj, list):
-                return [_serialize(v) for v in obj]
-            return obj
-
         item = _serialize(doc)
 
-        session = aioboto3.Session()
-        async with session.resource('dynamodb', region_name=REGION) as dynamo:
-            table = dynamo.Table(self.table_name)
-            if asyncio.iscoroutine(table):
-                table = await table
-            await table.put_item(Item=item)
+        table = await self._table()
+        await table.put_item(Item=item)
 
         class Result:
             inserted_id = doc['_id']
 
         return Result()
 
+    async def _batch_write(self, resource, items: List[Dict[str, Any]]):
+        requests = [{'PutRequest': {'Item': it}} for it in items]
+        for attempt in range(DYNAMODB_BATCH_MAX_ATTEMPTS):
+            resp = await resource.batch_write_item(RequestItems={self.table_name: requests})
+            requests = resp.get('UnprocessedItems', {}).get(self.table_name, [])
+            if not requests:
+                return
+            await asyncio.sleep(DYNAMODB_BATCH_BACKOFF_SECONDS * (2 ** attempt))
+        raise RuntimeError(f"{len(requests)} items still unprocessed by BatchWriteItem on {self.table_name}")
+
+    async def insert_many(self, docs: List[Dict[str, Any]]) -> Any:
+        """Put many items with BatchWriteItem, 25 per request and several requests at a time.
+
+        Like insert_one, items without `_id` get a UUID and existing items are overwritten.
+        Items DynamoDB leaves unprocessed are retried with backoff; RuntimeError is raised
+        if some are still unprocessed after DYNAMODB_BATCH_MAX_ATTEMPTS.
+        """
+        for doc in docs:
+            if '_id' not in doc:
+                doc['_id'] = str(uuid.uuid4())
+        # A request may not contain the same key twice; the last write of an _id wins
+        items = list({str(doc['_id']): _serialize(doc) for doc in docs}.values())
+        if items:
+            resource = await self._client.resource()
+            await _bounded_gather([
+                self._batch_write(resource, items[i:i + BATCH_WRITE_SIZE])
+                for i in range(0, len(items), BATCH_WRITE_SIZE)
+            ])
+
+        class Result:
+            inserted_ids = [doc['_id'] for doc in docs]
+
+        return Result()
+
     async def find_one(self, filter: Dict[str, Any]) -> Optional[Dict[str, Any]]:
-        session = aioboto3.Session()
-        async with session.resource('dynamodb', region_name=REGION) as dynamo:
-            table = dynamo.Table(self.table_name)
-            if asyncio.iscoroutine(table):
-                table = await table
-
-            # Get by primary key _id if present
-            if '_id' in filter:
-                key = {'_id': str(filter['_id'])}
-                resp = await table.get_item(Key=key)
-                return resp.get('Item')
-
-            # Try common single-attribute lookups (email)
-            if 'email' in filter:
-                # Prefer GSI on 'email' named 'email-index' if available; fall back to scan
-                resp = await table.query(IndexName='email-index', KeyConditionExpression=Key('email').eq(filter['email']))
-                items = resp.get('Items', [])
-                return items[0] if items else None
-
-            # Fallback: scan with filter expression (slow for large tables)
-            scan_kwargs = {'FilterExpression': None}
-            expr = None
-            for k, v in filter.items():
-                cond = Attr(k).eq(v)
-                expr = cond if expr is None else (expr & cond)
-            if expr is None:
-                resp = await table.scan()
-            else:
-                resp = await table.scan(FilterExpression=expr)
-
-            items = resp.get('Items', [])
-            return items[0] if items else None
+        # Planned like find(): GetItem by _id, Query on an index, or a scan up to the first match
+        async for item in self.find(filter):
+            return item
+        return None
+
+    async def _batch_get(self, resource, ids: List[str], projection: Optional[Sequence[str]]) -> List[Dict[str, Any]]:
+        request: Dict[str, Any] = {'Keys': [{'_id': i} for i in ids]}
+        if projection:
+            request.update(_projection(['_id', *projection]))
+        found: List[Dict[str, Any]] = []
+        for attempt in range(DYNAMODB_BATCH_MAX_ATTEMPTS):
+            resp = await resource.batch_get_item(RequestItems={self.table_name: request})
+            found.extend(resp.get('Responses', {}).get(self.table_name, []))
+            keys = resp.get('UnprocessedKeys', {}).get(self.table_name, {}).get('Keys')
+            if not keys:
+                return found
+            request = {**request, 'Keys': keys}
+            await asyncio.sleep(DYNAMODB_BATCH_BACKOFF_SECONDS * (2 ** attempt))
+        raise RuntimeError(f"{len(request['Keys'])} keys still unprocessed by BatchGetItem on {self.table_name}")
+
+    async def find_many_by_ids(self, ids: Sequence[Any], projection: Optional[Sequence[str]] = None) -> Dict[str, Dict[str, Any]]:
+        """Fetch items by `_id` with BatchGetItem (100 per request, several at a time).
+
+        Returns a dict of `_id` -> item; ids that do not exist are absent from it.
+        """
+        unique = list(dict.fromkeys(str(i) for i in ids if i is not None))
+        if not unique:
+            return {}
+        resource = await self._client.resource()
+        batches = await _bounded_gather([
+            self._batch_get(resource, unique[i:i + BATCH_GET_SIZE], projection)
+            for i in range(0, len(unique), BATCH_GET_SIZE)
+        ])
+        return {item['_id']: item for batch in batches for item in batch}
 
     async def update_one(self, filter: Dict[str, Any], update: Dict[str, Any]) -> Any:
+        """Apply a `$set` update to the item matching `filter` in a single conditional UpdateItem.
+
+        Every filter field other than `_id` becomes part of the ConditionExpression (the item
+        must also exist), so a check-and-set such as "status is still UPLOADING" is atomic.
+        The result has `matched_count` (0 when the condition failed) and `document`, the
+        updated item (ReturnValues=ALL_NEW), so no read-back is needed.
+        """
         # Support only $set updates used in codebase
-        session = aioboto3.Session()
-        async with session.resource('dynamodb', region_name=REGION) as dynamo:
-            table = dynamo.Table(self.table_name)
-            if asyncio.iscoroutine(table):
-                table = await table
-            if '_id' in filter:
-                key = {'_id': str(filter['_id'])}
-            else:
-                # Attempt to find the item then update by its _id
-                item = await self.find_one(filter)
-                if not item:
-                    return None
-                key = {'_id': item['_id']}
-
-            set_obj = update.get('$set', {})
-            if not set_obj:
-                # Not supported, no-op
-                return None
-
-            expr_parts = []
-            expr_vals = {}
-            def _serialize_value(v):
-                if isinstance(v, (datetime, date)):
-                    return v.isoformat()
-                if isinstance(v, uuid.UUID):
-                    return str(v)
-                if isinstance(v, dict):
-                    return {kk: _serialize_value(vv) for kk, vv in v.items()}
-                if isinstance(v, list):
-                    return [_serialize_value(x) for x in v]
-                return v
-
-            for i, (k, v) in enumerate(set_obj.items()):
-                placeholder = f":v{i}"
-                expr_parts.append(f"#{k} = {placeholder}")
-                expr_vals[placeholder] = _serialize_value(v)
-
-            # Build ExpressionAttributeNames and Values
-            expression_attribute_names = {f"#{k}": k for k in set_obj.keys()}
-            expression_attribute_values = expr_vals
-            update_expression = "SET " + ", ".join(expr_parts)
-
-            await table.update_item(
+        table = await self._table()
+        if '_id' in filter:
+            key = {'_id': str(filter['_id'])}
+        else:
+            # Attempt to find the item then update by its _id
+            item = await self.find_one(filter)
+            if not item:
+                return _UpdateResult(0, None)
+            key = {'_id': item['_id']}
+
+        set_obj = update.get('$set', {})
+        if not set_obj:
+            # Not supported, no-op
+            return None
+
+        expr_parts = []
+        expr_vals = {}
+        for i, (k, v) in enumerate(set_obj.items()):
+            # ":s" prefix: the condition builder generates its own ":v<n>" placeholders
+            placeholder = f":s{i}"
+            expr_parts.append(f"#{k} = {placeholder}")
+            expr_vals[placeholder] = _serialize(v)
+
+        # Build ExpressionAttributeNames and Values
+        expression_attribute_names = {f"#{k}": k for k in set_obj.keys()}
+        expression_attribute_values = expr_vals
+        update_expression = "SET " + ", ".join(expr_parts)
+
+        condition = Attr('_id').exists()
+        for k, v in filter.items():
+            if k != '_id':
+                condition = condition & Attr(k).eq(_serialize(v))
+
+        try:
+            resp = await table.update_item(
                 Key=key,
                 UpdateExpression=update_expression,
+                ConditionExpression=condition,
                 ExpressionAttributeNames=expression_attribute_names,
                 ExpressionAttributeValues=expression_attribute_values,
+                ReturnValues='ALL_NEW',
             )
-
-        class Result:
-            matched_count = 1
-
-        return Result()
-
-    async def find(self, filter: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
-        # Return an async generator that yields matching items
-        session = aioboto3.Session()
-        async with session.resource('dynamodb', region_name=REGION) as dynamo:
-            table = dynamo.Table(self.table_name)
-            if asyncio.iscoroutine(table):
-                table = await table
-
-            # If querying by document_id and GSI exists, use query; else scan
-            if 'document_id' in filter:
-                try:
-                    resp = await table.query(IndexName='document_id-index', KeyConditionExpression=Key('document_id').eq(filter['document_id']))
-                    items = resp.get('Items', [])
-                    for it in items:
-                        yield it
-                    return
-                except Exception:
-                    # Fall back to scan
-                    pass
-
-            # Build filter expression
-            expr = None
-            for k, v in filter.items():
-                cond = Attr(k).eq(v)
-                expr = cond if expr is None else (expr & cond)
-
-            if expr is None:
-                resp = await table.scan()
-            else:
-                resp = await table.scan(FilterExpression=expr)
-
-            items = resp.get('Items', [])
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return _UpdateResult(0, None)
+            raise
+
+        return _UpdateResult(1, resp.get('Attributes'))
+
+    def _plan(self, filter: Dict[str, Any]) -> Tuple[str, Dict[str, Any], List[str]]:
+        """Choose how to read the items matching an equality filter.
+
+        Returns the table method, its request arguments and the key attributes of the read:
+        GetItem when `_id` is given, Query on a registered index (COLLECTION_INDEXES) when
+        one of its attributes is filtered on, and otherwise a full-table Scan. Remaining
+        filter fields become a FilterExpression.
+        """
+        if '_id' in filter:
+            return 'get_item', {'Key': {'_id': str(filter['_id'])}}, ['_id']
+
+        for attr, index_name in COLLECTION_INDEXES.get(self.table_name, {}).items():
+            if attr not in filter:
+                continue
+            kwargs = {
+                'IndexName': index_name,
+                'KeyConditionExpression': Key(attr).eq(filter[attr]),
+            }
+            rest = _equals({k: v for k, v in filter.items() if k != attr})
+            if rest is not None:
+                kwargs['FilterExpression'] = rest
+            return 'query', kwargs, ['_id', attr]
+
+        expr = _equals(filter)
+        if expr is None:
+            return 'scan', {}, ['_id']
+        logger.warning("No index for filter %s on %s; scanning the whole table", sorted(filter), self.table_name)
+        return 'scan', {'FilterExpression': expr}, ['_id']
+
+    def start_key(self, filter: Dict[str, Any], cursor: Optional[str]) -> Optional[Dict[str, Any]]:
+        """Decode a cursor from find_page and check it against the read it is meant to resume.
+
+        Raises ValueError for a malformed or tampered cursor (wrong key attributes, or a key
+        outside the filtered partition) before any request reaches DynamoDB.
+        """
+        if not cursor:
+            return None
+        key = decode_cursor(cursor)
+        _, _, keys = self._plan(filter)
+        if '_id' not in key or not set(key) <= set(keys) or not all(isinstance(v, str) and v for v in key.values()):
+            raise ValueError("Invalid cursor")
+        for attr in keys:
+            if attr not in filter:
+                continue
+            if attr in key and key[attr] != filter[attr]:
+                raise ValueError("Invalid cursor")
+            # A cursor written by the scan fallback only holds _id; complete it for the query
+            key[attr] = filter[attr]
+        return key
+
+    async def _pages(
+        self,
+        filter: Dict[str, Any],
+        projection: Optional[Sequence[str]] = None,
+        page_size: Optional[int] = None,
+        start_key: Optional[Dict[str, Any]] = None,
+    ) -> AsyncIterator[Tuple[List[Dict[str, Any]], Optional[Dict[str, Any]], List[str]]]:
+        """Yield (items, LastEvaluatedKey, key attributes) for every response page of a read."""
+        table = await self._table()
+        method, kwargs, keys = self._plan(filter)
+        if projection:
+            # Key (and filtered) attributes are always returned so a page can be resumed from any item
+            kwargs.update(_projection([*keys, *filter, *projection]))
+
+        if method == 'get_item':
+            if start_key:
+                return
+            resp = await table.get_item(**kwargs)
+            item = resp.get('Item')
+            if item and all(item.get(k) == v for k, v in filter.items() if k != '_id'):
+                yield [item], None, keys
+            return
+
+        if page_size:
+            kwargs['Limit'] = page_size
+        if start_key:
+            kwargs['ExclusiveStartKey'] = start_key
+
+        first = True
+        while True:
+            try:
+                resp = await getattr(table, method)(**kwargs)
+            except Exception as e:
+                if method != 'query' or not first:
+                    raise
+                # Index not created yet (see backend/create_dynamo_indexes.py): fall back to a scan
+                logger.warning("Query on %s.%s failed (%s); falling back to a table scan",
+                               self.table_name, kwargs.get('IndexName'), e)
+                method = 'scan'
+                kwargs.pop('IndexName', None)
+                kwargs.pop('KeyConditionExpression', None)
+                kwargs['FilterExpression'] = _equals(filter)
+                keys = ['_id']
+                if start_key:
+                    kwargs['ExclusiveStartKey'] = {'_id': start_key['_id']}
+                continue
+            first = False
+            last = resp.get('LastEvaluatedKey')
+            yield resp.get('Items', []), last, keys
+            if not last:
+                return
+            kwargs['ExclusiveStartKey'] = last
+
+    async def find(
+        self,
+        filter: Dict[str, Any],
+        projection: Optional[Sequence[str]] = None,
+        page_size: Optional[int] = None,
+        cursor: Optional[str] = None,
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """Stream every matching item, following LastEvaluatedKey across response pages.
+
+        `projection` restricts the returned attributes (plus the key attributes), `page_size`
+        sets the Limit of each request and `cursor` (from find_page) resumes a previous read.
+        """
+        start_key = self.start_key(filter, cursor)
+        async for items, _, _ in self._pages(filter, projection, page_size, start_key):
             for it in items:
                 yield it
 
+    async def find_page(
+        self,
+        filter: Dict[str, Any],
+        limit: int,
+        cursor: Optional[str] = None,
+        projection: Optional[Sequence[str]] = None,
+    ) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Return up to `limit` matching items and a cursor for the next page (None at the end)."""
+        start_key = self.start_key(filter, cursor)
+        items: List[Dict[str, Any]] = []
+        async for page, last, keys in self._pages(filter, projection, limit, start_key):
+            for i, it in enumerate(page):
+                items.append(it)
+                if len(items) == limit:
+                    if i == len(page) - 1:
+                        return items, encode_cursor(last) if last else None
+                    # Resume right after this item rather than after the whole response page
+                    return items, encode_cursor({k: it[k] for k in keys})
+        return items, None
+
+
+class _LoopResource:
+    """A DynamoDB resource (and its connection pool) bound to one event loop."""
+
+    def __init__(self):
+        self.stack = AsyncExitStack()
+        self.resource = None
+        self.tables: Dict[str, Any] = {}
+        self.lock = asyncio.Lock()
+
 
 class DynamoDBClient:
+    """Shares one DynamoDB resource and connection pool per event loop.
+
+    aiobotocore connections belong to the loop they were opened on, so the API process
+    (one loop) holds a single resource, and each Celery worker thread with its own
+    persistent loop holds one as well. The resource is opened by start() (called from
+    the application/worker startup hooks) or lazily on first use, and released by close().
+    Tables are assumed to exist. Table names default to collection names.
+    """
+
     def __init__(self):
-        # Tables are assumed to exist. Table names default to collection names.
-        pass
+        self._resources: Dict[asyncio.AbstractEventLoop, _LoopResource] = {}
+        self._lock = threading.Lock()
+
+    def _loop_resource(self) -> _LoopResource:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._resources.get(loop)
+            if state is None:
+                state = self._resources[loop] = _LoopResource()
+            return state
+
+    async def start(self):
+        """Open the shared resource for the running event loop (no-op if already open)."""
+        state = self._loop_resource()
+        async with state.lock:
+            if state.resource is not None:
+                return state.resource
+            session = aioboto3.Session()
+            config = Config(max_pool_connections=DYNAMODB_MAX_POOL_CONNECTIONS)
+            state.resource = await state.stack.enter_async_context(
+                session.resource('dynamodb', region_name=REGION, config=config)
+            )
+            logger.info("Opened DynamoDB resource (pool of %d connections)", DYNAMODB_MAX_POOL_CONNECTIONS)
+            return state.resource
+
+    async def resource(self):
+        """Return the shared DynamoDB service resource of the running event loop."""
+        return self._loop_resource().resource or await self.start()
+
+    async def table(self, name: str):
+        """Return the cached table proxy for `name` on the running event loop."""
+        state = self._loop_resource()
+        table = state.tables.get(name)
+        if table is not None:
+            return table
+        resource = await self.resource()
+        table = resource.Table(name)
+        # Some versions of aioboto3 return coroutine-like table proxies
+        if asyncio.iscoroutine(table):
+            table = await table
+        state.tables[name] = table
+        return table
+
+    async def close(self):
+        """Close the resource of the running event loop and its connections."""
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            state = self._resources.pop(loop, None)
+        if state is None:
+            return
+        await state.stack.aclose()
+        logger.info("Closed DynamoDB resource")
 
     def get_collection(self, name: str) -> DynamoCollection:
-        return DynamoCollection(name)
+        return DynamoCollection(name, self)
 
 
 # Convenience: create a module-level client
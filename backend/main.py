@@ -1,7 +1,10 @@
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.responses import JSONResponse
 from fastapi.exceptions import RequestValidationError
+from contextlib import asynccontextmanager
 from backend.routers import auth, users, documents, chat
+from backend.database import db
+from backend.utils.storage import s3_clients
 import logging
 import sys
 
@@ -12,7 +15,19 @@ logging.basicConfig(
     handlers=[logging.StreamHandler(sys.stdout)],
 )
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Open the shared DynamoDB connection pool once instead of per request
+    await db.start()
+    try:
+        yield
+    finally:
+        await db.close()
+        await s3_clients.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 
 @app.exception_handler(RequestValidationError)
@@ -8,6 +8,9 @@ import asyncio
 from backend.database import db as mongo_db
 from backend.dynamodb_client import DynamoDBClient
 
+# Rows read from Mongo before they are written to DynamoDB together.
+BATCH_SIZE = 500
+
 async def migrate_collection(collection_name: str):
     print(f"Migrating collection: {collection_name}")
     mongo_coll = mongo_db.get_collection(collection_name)
@@ -16,13 +19,22 @@ async def migrate_collection(collection_name: str):
 
     cursor = mongo_coll.find({})
     count = 0
+    batch = []
     async for doc in cursor:
         # Convert ObjectId to string
         if '_id' in doc:
             doc['_id'] = str(doc['_id'])
         # Note: bson types (datetime) are preserved as-is and boto3 will handle them
-        await dyn_coll.insert_one(doc)
-        count += 1
+        batch.append(doc)
+        if len(batch) >= BATCH_SIZE:
+            # insert_many splits this into concurrent 25-item BatchWriteItem requests
+            await dyn_coll.insert_many(batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        await dyn_coll.insert_many(batch)
+        count += len(batch)
+    await dynamo.close()
     print(f"Migrated {count} items to {collection_name}")
 
 async def main():
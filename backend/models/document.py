@@ -21,6 +21,8 @@ class TextChunk(BaseModel):
     text: str
     page_number: int
     source: str  # one of TextSourceEnum values: 'TEXT', 'OCR', 'TABLE'
+    # Last page covered by the chunk when it spans several pages (set by the index chunker)
+    page_end: Optional[int] = None
 
 
 class TextSourceEnum(str, Enum):
@@ -39,6 +41,12 @@ class DocumentInDB(BaseModel):
     local_path: Optional[str] = None
     processing_status: ProcessingStatusEnum
     uploaded_at: datetime = Field(default_factory=datetime.utcnow)
+    # SHA-256 of the uploaded file, used to detect re-uploads of identical content
+    content_hash: Optional[str] = None
+    # Set when the document's results were cloned from an identical earlier upload
+    duplicate_of: Optional[str] = None
+    # Set for documents uploaded together through POST /documents/upload/batch
+    batch_id: Optional[str] = None
 
     class Config:
         validate_by_name = True
@@ -58,6 +66,11 @@ class GeneratedContentInDB(BaseModel):
         json_encoders = {datetime: lambda v: v.isoformat()}
 
 
+def generated_content_id(document_id: str, content_type: str) -> str:
+    """Deterministic _id of a document's generated item, so re-running generation overwrites it."""
+    return f"{document_id}:{content_type}"
+
+
 # Structured output models for LLM-generated content
 class Summary(BaseModel):
     summary: str
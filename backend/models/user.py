@@ -33,3 +33,5 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     email: EmailStr | None = None
+    # `uid` claim; absent in tokens issued before it was added
+    user_id: str | None = None
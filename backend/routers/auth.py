@@ -2,7 +2,11 @@ from fastapi import APIRouter, HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordRequestForm
 from backend.database import users_collection
 from backend.models.user import UserCreate, UserOut, Token
-from backend.utils.security import hash_password, verify_password, create_access_token
+from backend.models.user import UserInDB
+from backend.utils.security import (
+    hash_password_async, verify_password_async, create_access_token, token_claims,
+    get_current_user, password_pool_stats,
+)
 from bson.objectid import ObjectId
 from datetime import datetime, timezone
 
@@ -17,7 +21,7 @@ async def register_user(user: UserCreate):
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="User already exists")
 
     # Hash password
-    hashed = hash_password(user.password)
+    hashed = await hash_password_async(user.password)
 
     # Prepare user doc
     user_doc = {
@@ -48,9 +52,15 @@ async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends(
     if not user_doc:
         raise error
 
-    if not verify_password(form_data.password, user_doc.get("hashed_password", "")):
+    if not await verify_password_async(form_data.password, user_doc.get("hashed_password", "")):
         raise error
 
-    access_token = create_access_token({"sub": user_doc["email"]})
+    access_token = create_access_token(token_claims(user_doc))
 
     return {"access_token": access_token, "token_type": "bearer"}
+
+
+@router.get("/debug/password-hashing")
+async def debug_password_hashing(current_user: UserInDB = Depends(get_current_user)):
+    """Queueing metrics of the bcrypt pool used by register and login."""
+    return password_pool_stats()
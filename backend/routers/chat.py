@@ -5,6 +5,7 @@ from backend.utils.security import get_current_user
 from backend.models.user import UserInDB
 from backend.utils.search import create_langchain_indexes
 from backend.database import db
+from backend.utils.embedding_cache import EMBEDDING_CACHE, fleet_stats
 import inspect
 
 # Prefer the newer langchain_huggingface package when available, fall back to community wrapper
@@ -35,6 +36,12 @@ logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
+@router.get("/debug/embedding-cache")
+async def debug_embedding_cache(current_user: UserInDB = Depends(get_current_user)):
+    """Hit rate of the shared embedding cache across all indexing workers."""
+    return {"backend": EMBEDDING_CACHE, "fleet": fleet_stats()}
+
+
 @router.get("/debug/elasticsearch")
 async def debug_elasticsearch(current_user: UserInDB = Depends(get_current_user)):
     """Debug endpoint to inspect Elasticsearch index structure and sample documents."""
@@ -324,28 +331,29 @@ async def chat_endpoint(request: ChatRequest, current_user: UserInDB = Depends(g
     
     # Fetch document information to get names
     docs_collection = db.get_collection("documents")
-    doc_cache = {}
+
+    def _chunk_doc_id(meta):
+        return meta.get("document_id") or meta.get("document_id_str") or meta.get("source")
+
+    # Look up the names of all cited documents in one batch request
+    chunk_doc_ids = [_chunk_doc_id(getattr(d, "metadata", None) or {}) for d in top_chunks]
+    try:
+        found = await docs_collection.find_many_by_ids(chunk_doc_ids, projection=["original_filename"])
+    except Exception:
+        found = {}
+    doc_cache = {
+        doc_id: found.get(doc_id, {}).get("original_filename", "Unknown Document")
+        for doc_id in chunk_doc_ids if doc_id
+    }
     
     for idx, d in enumerate(top_chunks, start=1):
         text = d.page_content if hasattr(d, "page_content") else getattr(d, "content", "")
         meta = d.metadata if hasattr(d, "metadata") else {}
         # LangChain stores metadata as-is, so we can access page_number directly
-        doc_id = meta.get("document_id") or meta.get("document_id_str") or meta.get("source")
+        doc_id = _chunk_doc_id(meta)
         page_num = meta.get("page_number") or meta.get("page") or meta.get("page_num")
         
-        # Fetch document name from database if not cached
-        doc_name = "Unknown Document"
-        if doc_id:
-            if doc_id not in doc_cache:
-                try:
-                    doc = await docs_collection.find_one({"_id": doc_id})
-                    if doc:
-                        doc_cache[doc_id] = doc.get("original_filename", "Unknown Document")
-                    else:
-                        doc_cache[doc_id] = "Unknown Document"
-                except Exception:
-                    doc_cache[doc_id] = "Unknown Document"
-            doc_name = doc_cache.get(doc_id, "Unknown Document")
+        doc_name = doc_cache.get(doc_id, "Unknown Document") if doc_id else "Unknown Document"
         
         source_entry = {
             "document_id": doc_id,
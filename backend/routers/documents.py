@@ -1,4 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Header, Query, Response
 from pydantic import BaseModel
 import logging
 from backend.utils.security import get_current_user
@@ -10,13 +10,20 @@ from langchain.output_parsers import PydanticOutputParser
 from langchain.prompts import PromptTemplate
 from langchain_mistralai.chat_models import ChatMistralAI
 from backend.utils.search import create_langchain_indexes
+from backend.utils.dedup import find_canonical, clone_document
+from backend.utils.storage import (
+    MAX_UPLOAD_BYTES, complete_multipart_upload, get_s3_client, head_upload, presign_upload, upload_stream,
+)
 from backend.database import db
+import hmac
 import uuid
+import asyncio
 from pathlib import Path
+from urllib.parse import unquote_plus
 from datetime import datetime
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
+from celery import group
 from celery_worker import process_document as process_document_task
-import boto3
 import os
 from dotenv import load_dotenv 
 load_dotenv()  # Load environment variables from .env file  
@@ -25,9 +32,31 @@ router = APIRouter()
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+# Shared secret expected in the X-Webhook-Secret header of S3 event notifications; the
+# /documents/s3-events hook is disabled while unset.
+S3_EVENT_WEBHOOK_SECRET = os.getenv("S3_EVENT_WEBHOOK_SECRET", "")
+# Files accepted by one batch upload, and how many of them are streamed to S3 at once.
+UPLOAD_BATCH_MAX_FILES = int(os.getenv("UPLOAD_BATCH_MAX_FILES", "50"))
+UPLOAD_BATCH_CONCURRENCY = int(os.getenv("UPLOAD_BATCH_CONCURRENCY", "4"))
+
 
 class UploadRequest(BaseModel):
     filename: str
+    # Size in bytes, signed into the upload URLs; files larger than one upload part get
+    # presigned multipart URLs
+    size: int
+    content_type: str = "application/pdf"
+
+
+class UploadedPart(BaseModel):
+    part_number: int
+    etag: str
+
+
+class CompleteUploadRequest(BaseModel):
+    # Only for multipart uploads: the upload id and the ETag returned for every part
+    upload_id: Optional[str] = None
+    parts: List[UploadedPart] = []
 
 
 def _transform_mindmap_to_graph(node: Dict[str, Any], parent_id: str | None = None, counter: List[int] = None) -> tuple[List[Dict], List[Dict]]:
@@ -250,69 +279,115 @@ async def process_document(document_id: str, user_id: str):
             # otherwise loop to retry
 
 
-# @router.post("/documents/upload")
-# async def upload_document(request: UploadRequest, current_user: UserInDB = Depends(get_current_user)):
-#     """
-#     Generate a presigned URL for direct S3 upload.
-#     Frontend will use this URL to upload the file directly to S3.
-#     """
-#     user_id = str(current_user.get("_id") or current_user.get("id"))
-    
-#     # Generate unique S3 key
-#     file_ext = Path(request.filename).suffix or ".pdf"
-#     unique_name = f"{uuid.uuid4().hex}{file_ext}"
-#     s3_key = f"{user_id}/{unique_name}"
-    
-#     # Create document record with UPLOADING status
-#     docs_collection = db.get_collection("documents")
-#     document = {
-#         "user_id": user_id,
-#         "original_filename": request.filename,
-#         "s3_key": s3_key,
-#         "processing_status": ProcessingStatusEnum.UPLOADING.value,
-#         "uploaded_at": datetime.utcnow(),
-#     }
-
-#     result = await docs_collection.insert_one(document)
-#     document_id = str(result.inserted_id)
-    
-#     # Generate presigned URL for S3 upload
-#     try:
-#         s3_client = boto3.client(
-#             's3',
-#             region_name=os.getenv('AWS_REGION'),
-#             aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-#             aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY')
-#         )
-        
-#         bucket_name = os.getenv('AWS_S3_BUCKET_NAME')
-#         if not bucket_name:
-#             raise HTTPException(status_code=500, detail="S3 bucket name not configured")
-        
-#         presigned_url = s3_client.generate_presigned_url(
-#             'put_object',
-#             Params={'Bucket': bucket_name, 'Key': s3_key, 'ContentType': 'application/pdf'},
-#             ExpiresIn=3600  # 1 hour
-#         )
-        
-#         logger.info("Generated presigned URL for document %s with S3 key %s", document_id, s3_key)
-        
-#         return {
-#             "message": "Upload URL generated successfully",
-#             "document_id": document_id,
-#             "presigned_url": presigned_url,
-#             "s3_key": s3_key,
-#             "status": ProcessingStatusEnum.UPLOADING.value
-#         }
-        
-#     except Exception as e:
-#         # Update status to FAILED if presigned URL generation fails
-#         await docs_collection.update_one(
-#             {"_id": result.inserted_id}, 
-#             {"$set": {"processing_status": ProcessingStatusEnum.FAILED.value}}
-#         )
-#         logger.exception("Failed to generate presigned URL for document %s: %s", document_id, e)
-#         raise HTTPException(status_code=500, detail="Failed to generate upload URL")
+@router.post("/documents/upload-url")
+async def create_upload_url(request: UploadRequest, current_user: UserInDB = Depends(get_current_user)):
+    """
+    Create a document and return presigned URLs for uploading it directly to S3.
+
+    Files up to one part get a single PUT URL; larger files get a multipart upload with one
+    URL per part. The URLs only accept exactly `size` bytes. After uploading, call
+    POST /documents/{document_id}/complete-upload (with the part ETags for multipart).
+    """
+    user_id = str(current_user.get("_id") or current_user.get("id"))
+    if request.size <= 0:
+        raise HTTPException(status_code=400, detail="File size must be positive")
+    if request.size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File too large (limit {MAX_UPLOAD_BYTES} bytes)")
+    if not os.getenv('AWS_S3_BUCKET_NAME'):
+        raise HTTPException(status_code=500, detail="S3 bucket name not configured")
+
+    # Generate unique S3 key
+    file_ext = Path(request.filename).suffix or ".pdf"
+    unique_name = f"{uuid.uuid4().hex}{file_ext}"
+    s3_key = f"{user_id}/{unique_name}"
+
+    # Create document record with UPLOADING status
+    docs_collection = db.get_collection("documents")
+    document = {
+        "user_id": user_id,
+        "original_filename": request.filename,
+        "s3_key": s3_key,
+        # Declared size, checked against the stored object before processing starts
+        "upload_size": request.size,
+        "processing_status": ProcessingStatusEnum.UPLOADING.value,
+        "uploaded_at": datetime.utcnow(),
+    }
+    result = await docs_collection.insert_one(document)
+    document_id = str(result.inserted_id)
+
+    try:
+        upload = await presign_upload(s3_key, request.size, request.content_type)
+    except Exception as e:
+        # Update status to FAILED if presigned URL generation fails
+        await docs_collection.update_one(
+            {"_id": document_id},
+            {"$set": {"processing_status": ProcessingStatusEnum.FAILED.value}}
+        )
+        logger.exception("Failed to generate presigned URL for document %s: %s", document_id, e)
+        raise HTTPException(status_code=500, detail="Failed to generate upload URL")
+
+    if upload.get("upload_id"):
+        # Remembered so only this document's multipart upload can be completed for it
+        await docs_collection.update_one({"_id": document_id}, {"$set": {"upload_id": upload["upload_id"]}})
+    logger.info("Generated %s presigned upload for document %s with S3 key %s", upload["method"], document_id, s3_key)
+
+    return {
+        "message": "Upload URL generated successfully",
+        "document_id": document_id,
+        "s3_key": s3_key,
+        "status": ProcessingStatusEnum.UPLOADING.value,
+        "upload": upload,
+    }
+
+
+async def _upload_duplicate(document_id: str, filename: str, user_id: str, content_hash: str,
+                            canonical: Dict[str, Any]) -> Dict[str, Any]:
+    """Complete a re-uploaded file's document by cloning the results of its canonical copy.
+
+    The document keeps its own S3 object (under the uploader's prefix), so it never exposes
+    or depends on another user's object. If cloning fails, the document is handed to the
+    regular Celery pipeline instead.
+    """
+    docs_collection = db.get_collection("documents")
+    await docs_collection.update_one(
+        {"_id": document_id},
+        {"$set": {"duplicate_of": canonical["_id"], "processing_status": ProcessingStatusEnum.PROCESSING.value}}
+    )
+    logger.info("Upload %s duplicates document %s (sha256=%s); cloning results", document_id, canonical["_id"], content_hash)
+
+    try:
+        await clone_document(canonical, document_id, user_id)
+        await docs_collection.update_one(
+            {"_id": document_id},
+            {"$set": {"processing_status": ProcessingStatusEnum.COMPLETED.value}}
+        )
+        return {
+            "message": "File already processed; results reused",
+            "document_id": document_id,
+            "filename": filename,
+            "status": ProcessingStatusEnum.COMPLETED.value,
+            "duplicate_of": canonical["_id"],
+            "note": "This endpoint is deprecated. Please migrate to the presigned URL flow."
+        }
+    except Exception as e:
+        logger.exception("Cloning %s from %s failed; falling back to full processing: %s", document_id, canonical["_id"], e)
+
+    try:
+        process_document_task.delay(document_id, user_id)
+    except Exception as e:
+        logger.exception("Failed to start processing for %s: %s", document_id, e)
+        await docs_collection.update_one(
+            {"_id": document_id},
+            {"$set": {"processing_status": ProcessingStatusEnum.FAILED.value}}
+        )
+        raise HTTPException(status_code=500, detail="Failed to start document processing")
+    return {
+        "message": "File uploaded and processing started",
+        "document_id": document_id,
+        "filename": filename,
+        "status": ProcessingStatusEnum.PROCESSING.value,
+        "note": "This endpoint is deprecated. Please migrate to the presigned URL flow."
+    }
 
 
 @router.post("/documents/upload")
@@ -322,9 +397,9 @@ async def upload_document_legacy(file: UploadFile = File(...), current_user: Use
     This endpoint accepts multipart file uploads and handles the S3 upload server-side.
     
     NOTE: This is a temporary compatibility endpoint. Please migrate to the presigned URL flow:
-    1. Call POST /documents/upload with JSON {filename}
-    2. Upload to the returned presigned_url
-    3. Call POST /documents/{document_id}/start-processing
+    1. Call POST /documents/upload-url with JSON {filename, size}
+    2. Upload to the returned presigned URL(s)
+    3. Call POST /documents/{document_id}/complete-upload
     """
     user_id = str(current_user.get("_id") or current_user.get("id"))
     
@@ -332,13 +407,18 @@ async def upload_document_legacy(file: UploadFile = File(...), current_user: Use
     if not file.filename:
         raise HTTPException(status_code=400, detail="No filename provided")
     
+    bucket_name = os.getenv('AWS_S3_BUCKET_NAME')
+    if not bucket_name:
+        raise HTTPException(status_code=500, detail="S3 bucket name not configured")
+    docs_collection = db.get_collection("documents")
+
     # Generate unique S3 key
     file_ext = Path(file.filename).suffix or ".pdf"
     unique_name = f"{uuid.uuid4().hex}{file_ext}"
     s3_key = f"{user_id}/{unique_name}"
-    
-    # Create document record
-    docs_collection = db.get_collection("documents")
+
+    # Create the document record first (as UPLOADING), so every object that reaches S3
+    # belongs to a document, and one that cannot be processed is left marked FAILED
     document = {
         "user_id": user_id,
         "original_filename": file.filename,
@@ -346,85 +426,232 @@ async def upload_document_legacy(file: UploadFile = File(...), current_user: Use
         "processing_status": ProcessingStatusEnum.UPLOADING.value,
         "uploaded_at": datetime.utcnow(),
     }
-
     result = await docs_collection.insert_one(document)
     document_id = str(result.inserted_id)
-    
-    try:
-        # Read file content
-        file_content = await file.read()
-        
-        # Upload directly to S3
-        s3_client = boto3.client(
-            's3',
-            region_name=os.getenv('AWS_REGION'),
-            aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
-            aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
-            aws_session_token=os.getenv('AWS_SESSION_TOKEN')
-        )
-        
-        bucket_name = os.getenv('AWS_S3_BUCKET_NAME')
-        if not bucket_name:
-            raise HTTPException(status_code=500, detail="S3 bucket name not configured")
-        
-        s3_client.put_object(
-            Bucket=bucket_name,
-            Key=s3_key,
-            Body=file_content,
-            ContentType='application/pdf'
-        )
-        
-        logger.info("Uploaded file directly to S3: %s", s3_key)
-        
-        # Start processing immediately
+
+    async def mark_failed():
         try:
-            process_document_task.delay(document_id, user_id)
-            # Update status to PROCESSING
             await docs_collection.update_one(
-                {"_id": document_id}, 
-                {"$set": {"processing_status": ProcessingStatusEnum.PROCESSING.value}}
+                {"_id": document_id},
+                {"$set": {"processing_status": ProcessingStatusEnum.FAILED.value}}
             )
-            processing_status = ProcessingStatusEnum.PROCESSING.value
         except Exception as e:
-            logger.exception("Failed to start processing for %s: %s", document_id, e)
-            processing_status = ProcessingStatusEnum.UPLOADING.value
-        
-        return {
-            "message": "File uploaded and processing started",
-            "document_id": document_id,
-            "filename": file.filename,
-            "status": processing_status,
-            "note": "This endpoint is deprecated. Please migrate to the presigned URL flow."
-        }
-        
+            logger.exception("Failed to mark document %s FAILED: %s", document_id, e)
+
+    # Stream the file to S3 in bounded parts (multipart for large files), fingerprinting it on the way
+    try:
+        upload = await upload_stream(file, s3_key, bucket_name)
     except Exception as e:
-        # Update status to FAILED
+        logger.exception("Failed to upload file %s to S3: %s", file.filename, e)
+        await mark_failed()
+        raise HTTPException(status_code=500, detail="Failed to upload file to S3")
+    content_hash = upload.sha256
+
+    try:
+        await docs_collection.update_one({"_id": document_id}, {"$set": {"content_hash": content_hash}})
+
+        # Identical content that has already been processed: reuse its chunks, vectors and
+        # generated content instead of running the pipeline again
+        try:
+            canonical = await find_canonical(content_hash)
+        except Exception as e:
+            logger.warning("Content hash lookup failed for %s: %s", content_hash, e)
+            canonical = None
+        if canonical:
+            return await _upload_duplicate(document_id, file.filename, user_id, content_hash, canonical)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Failed to record upload of %s: %s", document_id, e)
+        await mark_failed()
+        raise HTTPException(status_code=500, detail="Failed to record the uploaded file")
+
+    # Start processing immediately
+    try:
+        process_document_task.delay(document_id, user_id)
+        # Update status to PROCESSING
         await docs_collection.update_one(
-            {"_id": result.inserted_id}, 
-            {"$set": {"processing_status": ProcessingStatusEnum.FAILED.value}}
+            {"_id": document_id}, 
+            {"$set": {"processing_status": ProcessingStatusEnum.PROCESSING.value}}
         )
-        logger.exception("Failed to upload file for document %s: %s", document_id, e)
-        raise HTTPException(status_code=500, detail="Failed to upload file to S3")
+        processing_status = ProcessingStatusEnum.PROCESSING.value
+    except Exception as e:
+        logger.exception("Failed to start processing for %s: %s", document_id, e)
+        processing_status = ProcessingStatusEnum.UPLOADING.value
+    
+    return {
+        "message": "File uploaded and processing started",
+        "document_id": document_id,
+        "filename": file.filename,
+        "status": processing_status,
+        "note": "This endpoint is deprecated. Please migrate to the presigned URL flow."
+    }
 
 
-@router.post("/documents/{document_id}/start-processing")
-async def start_processing(document_id: str, current_user: UserInDB = Depends(get_current_user)):
+@router.post("/documents/upload/batch")
+async def upload_documents_batch(files: List[UploadFile] = File(...), current_user: UserInDB = Depends(get_current_user)):
     """
-    Start processing a document after it has been uploaded to S3.
-    Frontend should call this after successfully uploading the file using the presigned URL.
+    Upload many files at once.
+
+    All document records are written first (as UPLOADING, with one batch write), then the
+    files are streamed to S3 with bounded concurrency and processing of the uploaded ones
+    is enqueued as a single Celery group. Progress of the whole batch is available from
+    GET /documents/batches/{batch_id}. Re-uploads of already processed content are
+    detected by the pipeline and cloned there.
     """
+    user_id = str(current_user.get("_id") or current_user.get("id"))
+    if not files:
+        raise HTTPException(status_code=400, detail="No files provided")
+    if len(files) > UPLOAD_BATCH_MAX_FILES:
+        raise HTTPException(status_code=413, detail=f"Too many files (limit {UPLOAD_BATCH_MAX_FILES})")
+    if any(not f.filename for f in files):
+        raise HTTPException(status_code=400, detail="No filename provided")
+    bucket_name = os.getenv('AWS_S3_BUCKET_NAME')
+    if not bucket_name:
+        raise HTTPException(status_code=500, detail="S3 bucket name not configured")
+
+    batch_id = uuid.uuid4().hex
+    documents = [
+        {
+            "_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "original_filename": file.filename,
+            "s3_key": f"{user_id}/{uuid.uuid4().hex}{Path(file.filename).suffix or '.pdf'}",
+            "batch_id": batch_id,
+            "processing_status": ProcessingStatusEnum.UPLOADING.value,
+            "uploaded_at": datetime.utcnow(),
+        }
+        for file in files
+    ]
+    # Records first, so every object that reaches S3 belongs to a document and a batch
     docs_collection = db.get_collection("documents")
+    await docs_collection.insert_many(documents)
+    await db.get_collection("upload_batches").insert_one({
+        "_id": batch_id,
+        "user_id": user_id,
+        "document_ids": [d["_id"] for d in documents],
+        "created_at": datetime.utcnow(),
+    })
+
+    semaphore = asyncio.Semaphore(UPLOAD_BATCH_CONCURRENCY)
+
+    async def store(file: UploadFile, document: Dict[str, Any]):
+        update = {"processing_status": ProcessingStatusEnum.FAILED.value}
+        async with semaphore:
+            try:
+                upload = await upload_stream(file, document["s3_key"], bucket_name)
+                update = {"content_hash": upload.sha256, "processing_status": ProcessingStatusEnum.PROCESSING.value}
+            except Exception as e:
+                logger.exception("Batch %s: failed to upload %s to S3: %s", batch_id, file.filename, e)
+        try:
+            await docs_collection.update_one({"_id": document["_id"]}, {"$set": update})
+            document.update(update)
+        except Exception as e:
+            # Left in UPLOADING and listed in the batch; start-processing can still pick it up
+            logger.exception("Batch %s: failed to record upload of %s: %s", batch_id, document["_id"], e)
+
+    await asyncio.gather(*(store(f, d) for f, d in zip(files, documents)))
+
+    uploaded = [d for d in documents if d["processing_status"] == ProcessingStatusEnum.PROCESSING.value]
+    if uploaded:
+        try:
+            group(process_document_task.s(d["_id"], user_id) for d in uploaded).apply_async()
+        except Exception as e:
+            logger.exception("Batch %s: failed to enqueue processing: %s", batch_id, e)
+            for d in uploaded:
+                await docs_collection.update_one(
+                    {"_id": d["_id"]},
+                    {"$set": {"processing_status": ProcessingStatusEnum.FAILED.value}}
+                )
+                d["processing_status"] = ProcessingStatusEnum.FAILED.value
+    logger.info("Batch %s: %d of %d files uploaded and enqueued", batch_id, len(uploaded), len(documents))
+
+    return {
+        "message": "Files uploaded and processing started",
+        "batch_id": batch_id,
+        "documents": [
+            {"document_id": d["_id"], "filename": d["original_filename"], "status": d["processing_status"]}
+            for d in documents
+        ],
+    }
+
+
+@router.get("/documents/batches/{batch_id}")
+async def get_upload_batch(batch_id: str, current_user: UserInDB = Depends(get_current_user)):
+    """Aggregate processing progress of a batch upload."""
     user_id = str(current_user.get("_id") or current_user.get("id"))
-    
-    # Verify document ownership and that it's in UPLOADING status
-    doc = await docs_collection.find_one({"_id": document_id})
-    if not doc:
-        raise HTTPException(status_code=404, detail="Document not found")
-    
-    if str(doc.get("user_id")) != user_id:
-        raise HTTPException(status_code=404, detail="Document not found")
-    
-    if doc.get("processing_status") != ProcessingStatusEnum.UPLOADING.value:
+    batch = await db.get_collection("upload_batches").find_one({"_id": batch_id})
+    if not batch or str(batch.get("user_id")) != user_id:
+        raise HTTPException(status_code=404, detail="Batch not found")
+
+    found = await db.get_collection("documents").find_many_by_ids(
+        batch["document_ids"], projection=["original_filename", "processing_status"],
+    )
+    documents = []
+    counts = {status.value: 0 for status in ProcessingStatusEnum}
+    for document_id in batch["document_ids"]:
+        doc = found.get(document_id) or {}
+        status = doc.get("processing_status", ProcessingStatusEnum.FAILED.value)
+        counts[status] = counts.get(status, 0) + 1
+        documents.append({"document_id": document_id, "filename": doc.get("original_filename"), "status": status})
+
+    total = len(documents)
+    done = counts[ProcessingStatusEnum.COMPLETED.value] + counts[ProcessingStatusEnum.FAILED.value]
+    return {
+        "batch_id": batch_id,
+        "created_at": batch.get("created_at"),
+        "total": total,
+        "counts": counts,
+        "progress": round(done / total, 4) if total else 1.0,
+        "finished": done == total,
+        "documents": documents,
+    }
+
+
+async def _verify_upload(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """Check the stored object of a presigned upload before it is processed.
+
+    The object must exist, be at most MAX_UPLOAD_BYTES and match the declared size. An
+    object that fails the size checks is deleted and its document marked FAILED.
+    """
+    head = await head_upload(doc["s3_key"])
+    if not head or not head.get("ContentLength"):
+        raise HTTPException(status_code=400, detail="Uploaded file not found in storage")
+    size = head["ContentLength"]
+    declared = doc.get("upload_size")
+    if size <= MAX_UPLOAD_BYTES and (declared is None or size == declared):
+        return head
+
+    logger.warning("Rejecting upload of %s: %d bytes stored, %s declared, limit %d",
+                   doc["_id"], size, declared, MAX_UPLOAD_BYTES)
+    try:
+        s3_client = await get_s3_client()
+        await s3_client.delete_object(Bucket=os.getenv('AWS_S3_BUCKET_NAME'), Key=doc["s3_key"])
+    except Exception as e:
+        logger.warning("Could not delete rejected upload %s: %s", doc["s3_key"], e)
+    await db.get_collection("documents").update_one(
+        {"_id": doc["_id"], "processing_status": ProcessingStatusEnum.UPLOADING.value},
+        {"$set": {"processing_status": ProcessingStatusEnum.FAILED.value}},
+    )
+    if size > MAX_UPLOAD_BYTES:
+        raise HTTPException(status_code=413, detail=f"File too large (limit {MAX_UPLOAD_BYTES} bytes)")
+    raise HTTPException(status_code=400, detail="Uploaded file size does not match the declared size")
+
+
+async def _start_processing(document_id: str, user_id: str) -> Dict[str, Any]:
+    """Move an uploaded document from UPLOADING to PROCESSING and enqueue its processing."""
+    docs_collection = db.get_collection("documents")
+
+    # Atomically move the document from UPLOADING to PROCESSING; a duplicate call (or a
+    # document of another user) fails the condition instead of enqueueing twice
+    res = await docs_collection.update_one(
+        {"_id": document_id, "user_id": user_id, "processing_status": ProcessingStatusEnum.UPLOADING.value},
+        {"$set": {"processing_status": ProcessingStatusEnum.PROCESSING.value}},
+    )
+    if not res.matched_count:
+        doc = await docs_collection.find_one({"_id": document_id})
+        if not doc or str(doc.get("user_id")) != user_id:
+            raise HTTPException(status_code=404, detail="Document not found")
         raise HTTPException(status_code=400, detail=f"Document is not in uploadable state. Current status: {doc.get('processing_status')}")
     
     # Schedule background processing via Celery
@@ -432,12 +659,6 @@ async def start_processing(document_id: str, current_user: UserInDB = Depends(ge
         logger.info("Enqueuing Celery task for document %s", document_id)
         process_document_task.delay(document_id, user_id)
         
-        # Update status to PROCESSING
-        await docs_collection.update_one(
-            {"_id": document_id}, 
-            {"$set": {"processing_status": ProcessingStatusEnum.PROCESSING.value}}
-        )
-        
         return {
             "message": "Document processing started",
             "document_id": document_id,
@@ -454,19 +675,137 @@ async def start_processing(document_id: str, current_user: UserInDB = Depends(ge
         raise HTTPException(status_code=500, detail="Failed to start document processing")
 
 
+@router.post("/documents/{document_id}/start-processing")
+async def start_processing(document_id: str, current_user: UserInDB = Depends(get_current_user)):
+    """
+    Start processing a document after it has been uploaded to S3.
+    Frontend should call this after successfully uploading the file using the presigned URL.
+    """
+    user_id = str(current_user.get("_id") or current_user.get("id"))
+    return await _start_processing(document_id, user_id)
+
+
+@router.post("/documents/{document_id}/complete-upload")
+async def complete_upload(
+    document_id: str,
+    request: CompleteUploadRequest = CompleteUploadRequest(),
+    current_user: UserInDB = Depends(get_current_user),
+):
+    """
+    Finish a presigned upload: assemble the multipart upload (if any), check the object in
+    S3 (it must exist and have the declared size) and start processing. Safe to call after the S3 event hook has
+    already started processing.
+    """
+    docs_collection = db.get_collection("documents")
+    user_id = str(current_user.get("_id") or current_user.get("id"))
+
+    doc = await docs_collection.find_one({"_id": document_id})
+    if not doc or str(doc.get("user_id")) != user_id:
+        raise HTTPException(status_code=404, detail="Document not found")
+    if doc.get("processing_status") != ProcessingStatusEnum.UPLOADING.value:
+        return {
+            "message": "Document upload already completed",
+            "document_id": document_id,
+            "status": doc.get("processing_status"),
+        }
+
+    if request.upload_id:
+        if request.upload_id != doc.get("upload_id") or not request.parts:
+            raise HTTPException(status_code=400, detail="Unknown upload id or no parts given")
+        try:
+            await complete_multipart_upload(doc["s3_key"], request.upload_id, [p.dict() for p in request.parts])
+        except Exception as e:
+            logger.warning("Completing multipart upload of %s failed: %s", document_id, e)
+            raise HTTPException(status_code=400, detail="Could not complete the multipart upload")
+
+    head = await _verify_upload(doc)
+    logger.info("Upload of %s complete (%d bytes)", document_id, head["ContentLength"])
+    return await _start_processing(document_id, user_id)
+
+
+@router.post("/documents/s3-events")
+async def s3_upload_events(event: Dict[str, Any], x_webhook_secret: Optional[str] = Header(None)):
+    """
+    S3 event notification hook (ObjectCreated), e.g. from an SNS HTTP subscription or a
+    MinIO webhook target. Starts processing for every object uploaded to the application
+    bucket that belongs to a document still in UPLOADING and passes the same checks as
+    complete-upload, so clients need not call complete-upload for single-part uploads. Authenticated with the shared S3_EVENT_WEBHOOK_SECRET (X-Webhook-Secret).
+    """
+    if not S3_EVENT_WEBHOOK_SECRET:
+        raise HTTPException(status_code=404, detail="Not found")
+    if not x_webhook_secret or not hmac.compare_digest(x_webhook_secret, S3_EVENT_WEBHOOK_SECRET):
+        raise HTTPException(status_code=401, detail="Invalid webhook secret")
+
+    docs_collection = db.get_collection("documents")
+    bucket_name = os.getenv('AWS_S3_BUCKET_NAME')
+    started, ignored = [], 0
+    for record in event.get("Records") or []:
+        if not str(record.get("eventName", "")).startswith("ObjectCreated"):
+            ignored += 1
+            continue
+        if record.get("s3", {}).get("bucket", {}).get("name") != bucket_name:
+            logger.warning("Ignoring S3 event for bucket %s", record.get("s3", {}).get("bucket", {}).get("name"))
+            ignored += 1
+            continue
+        # Object keys in S3 events are URL-encoded
+        s3_key = unquote_plus(record.get("s3", {}).get("object", {}).get("key", ""))
+        doc = await docs_collection.find_one({"s3_key": s3_key}) if s3_key else None
+        if not doc or doc.get("processing_status") != ProcessingStatusEnum.UPLOADING.value:
+            ignored += 1
+            continue
+        try:
+            await _verify_upload(doc)
+            await _start_processing(doc["_id"], str(doc["user_id"]))
+            started.append(doc["_id"])
+        except HTTPException as e:
+            # Rejected object, already claimed by complete-upload, or enqueueing failed (logged)
+            logger.info("S3 event for %s not processed: %s", s3_key, e.detail)
+            ignored += 1
+    return {"started": started, "ignored": ignored}
+
+
+# Attributes returned by GET /documents (pipeline bookkeeping such as checkpoints is left out)
+DOCUMENT_LIST_FIELDS = [
+    "_id", "user_id", "original_filename", "s3_key", "local_path", "processing_status",
+    "uploaded_at", "content_hash", "duplicate_of", "batch_id",
+]
+# Attributes of generated items used by GET /documents/{id}/generated
+GENERATED_CONTENT_FIELDS = ["_id", "document_id", "user_id", "content_type", "content_data", "created_at"]
+
+
 @router.get("/documents", response_model=List[DocumentInDB])
-async def get_documents(current_user: UserInDB = Depends(get_current_user)):
+async def get_documents(
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    current_user: UserInDB = Depends(get_current_user),
+):
     """
     Get all documents for the authenticated user.
     Handles backward compatibility for documents with local_path vs s3_key.
+
+    With `limit`, one page is returned and the cursor of the next page (if any) is sent in
+    the X-Next-Cursor header; pass it back as `cursor` to continue.
     """
     docs_collection = db.get_collection("documents")
     user_id = str(current_user.get("_id") or current_user.get("id"))
     
     # Query documents for current user
-    cursor = docs_collection.find({"user_id": user_id})
+    if limit is not None or cursor:
+        # Reject malformed or tampered cursors up front instead of failing in DynamoDB
+        try:
+            docs_collection.start_key({"user_id": user_id}, cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+        items, next_cursor = await docs_collection.find_page(
+            {"user_id": user_id}, limit=limit or 100, cursor=cursor, projection=DOCUMENT_LIST_FIELDS,
+        )
+        if next_cursor:
+            response.headers["X-Next-Cursor"] = next_cursor
+    else:
+        items = [d async for d in docs_collection.find({"user_id": user_id}, projection=DOCUMENT_LIST_FIELDS)]
     documents = []
-    async for d in cursor:
+    for d in items:
         # Convert _id to string
         d["_id"] = str(d["_id"])
         
@@ -506,7 +845,7 @@ async def get_generated_content(document_id: str, current_user: UserInDB = Depen
         raise HTTPException(status_code=404, detail="Document not found")
     
     # Fetch generated content
-    cursor = gen_collection.find({"document_id": document_id})
+    cursor = gen_collection.find({"document_id": document_id}, projection=GENERATED_CONTENT_FIELDS)
     generated_items = []
     async for it in cursor:
         generated_items.append(it)
@@ -0,0 +1,211 @@
+import io
+import os
+import gzip
+import json
+import asyncio
+import logging
+import shutil
+import tempfile
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import AsyncIterator, BinaryIO, Iterable, Iterator, List, Optional, Tuple
+from dotenv import load_dotenv
+load_dotenv()  # Load environment variables from .env file
+
+from backend.models.document import TextChunk
+from backend.utils.pdf_parser import PARSER_VERSION
+from backend.utils.storage import S3_DOWNLOAD_CHUNK_BYTES, get_s3_client, upload_stream
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Where extraction artifacts are kept: "s3" (the document bucket) or "local" (ARTIFACT_DIR).
+ARTIFACT_STORE = os.getenv("ARTIFACT_STORE", "s3").lower()
+ARTIFACT_DIR = os.getenv("ARTIFACT_DIR", "artifacts")
+# Key prefix for artifacts in the S3 bucket.
+ARTIFACT_PREFIX = os.getenv("ARTIFACT_PREFIX", "artifacts")
+# Directory for the temporary files artifacts are streamed through (default: the system temp dir).
+ARTIFACT_SPILL_DIR = os.getenv("ARTIFACT_SPILL_DIR") or None
+
+
+def artifact_key(content_hash: str, parser_version: str = PARSER_VERSION, part: Tuple[int, int] | None = None) -> str:
+    """Storage key of the extraction artifact for a PDF's content hash and a parser version.
+
+    `part` is a (start, stop) page range for the partial artifact of one extraction shard.
+    """
+    if part is not None:
+        return f"{content_hash}/v{parser_version}.pages-{part[0]:06d}-{part[1]:06d}.jsonl.gz"
+    return f"{content_hash}/v{parser_version}.jsonl.gz"
+
+
+def _encode_line(chunk: TextChunk) -> str:
+    # One compact JSON object per page-level chunk, in page order
+    return json.dumps(chunk.dict(exclude_none=True), separators=(",", ":"), ensure_ascii=False)
+
+
+def _encode(chunks: List[TextChunk]) -> bytes:
+    return gzip.compress("\n".join(_encode_line(c) for c in chunks).encode("utf-8"), compresslevel=6)
+
+
+def _local_path(key: str) -> Path:
+    return Path(ARTIFACT_DIR) / key
+
+
+def _iter_decoded(fileobj: BinaryIO) -> Iterator[TextChunk]:
+    """Decode a gzipped JSONL artifact one line at a time."""
+    with gzip.GzipFile(fileobj=fileobj, mode="rb") as gz:
+        for line in io.TextIOWrapper(gz, encoding="utf-8", newline="\n"):
+            line = line.rstrip("\n")
+            if line:
+                yield TextChunk(**json.loads(line))
+
+
+def _write_local(key: str, data: bytes):
+    _write_local_file(key, io.BytesIO(data))
+
+
+def _write_local_file(key: str, fileobj: BinaryIO):
+    path = _local_path(key)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    # Write to a temporary file first so concurrent readers never see a partial artifact
+    fd, tmp = tempfile.mkstemp(dir=path.parent, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            shutil.copyfileobj(fileobj, f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def _bucket() -> str:
+    bucket_name = os.getenv('AWS_S3_BUCKET_NAME')
+    if not bucket_name:
+        raise RuntimeError("AWS_S3_BUCKET_NAME not configured")
+    return bucket_name
+
+
+async def save_text_artifact(content_hash: str, chunks: List[TextChunk], parser_version: str = PARSER_VERSION,
+                             part: Tuple[int, int] | None = None):
+    """Store the extraction output for `content_hash` (or one page range of it) as gzipped JSONL."""
+    key = artifact_key(content_hash, parser_version, part)
+    data = await asyncio.to_thread(_encode, chunks)
+    if ARTIFACT_STORE == "local":
+        await asyncio.to_thread(_write_local, key, data)
+    else:
+        s3_client = await get_s3_client()
+        await s3_client.put_object(
+            Bucket=_bucket(),
+            Key=f"{ARTIFACT_PREFIX}/{key}",
+            Body=data,
+            ContentType='application/gzip',
+        )
+    logger.info("Saved extraction artifact %s (%d chunks, %d bytes)", key, len(chunks), len(data))
+
+
+async def text_artifact_exists(content_hash: str, parser_version: str = PARSER_VERSION) -> bool:
+    """Whether an extraction artifact is stored for `content_hash`, without reading it."""
+    if not content_hash:
+        return False
+    key = artifact_key(content_hash, parser_version)
+    try:
+        if ARTIFACT_STORE == "local":
+            return await asyncio.to_thread(_local_path(key).exists)
+        s3_client = await get_s3_client()
+        await s3_client.head_object(Bucket=_bucket(), Key=f"{ARTIFACT_PREFIX}/{key}")
+        return True
+    except Exception as e:
+        # A missing object (404) and a failed request are both treated as a miss
+        logger.info("No usable extraction artifact %s: %s", key, e)
+        return False
+
+
+@asynccontextmanager
+async def open_text_artifact(content_hash: str, parser_version: str = PARSER_VERSION,
+                             part: Tuple[int, int] | None = None) -> AsyncIterator[Optional[Iterator[TextChunk]]]:
+    """Yield an iterator over the stored extraction output for `content_hash`, or None when there is none.
+
+    Chunks are decoded one at a time while the iterator is consumed (an S3 artifact is
+    first downloaded into a temporary file), so memory stays bounded however large the
+    document is. The iterator can be consumed from another
+    thread, but only inside the `async with` block.
+    """
+    if not content_hash:
+        yield None
+        return
+    key = artifact_key(content_hash, parser_version, part)
+    if ARTIFACT_STORE == "local":
+        path = _local_path(key)
+        if not path.exists():
+            yield None
+            return
+        with open(path, "rb") as f:
+            yield _iter_decoded(f)
+        return
+
+    s3_client = await get_s3_client()
+    try:
+        response = await s3_client.get_object(Bucket=_bucket(), Key=f"{ARTIFACT_PREFIX}/{key}")
+    except s3_client.exceptions.NoSuchKey:
+        yield None
+        return
+    with tempfile.TemporaryFile(suffix=".jsonl.gz", dir=ARTIFACT_SPILL_DIR) as f:
+        async for data in response['Body'].iter_chunks(S3_DOWNLOAD_CHUNK_BYTES):
+            f.write(data)
+        logger.info("Streaming extraction artifact %s (%d bytes)", key, f.tell())
+        f.seek(0)
+        yield _iter_decoded(f)
+
+
+class _AsyncFileReader:
+    """Gives a local file the async `read(n)` that upload_stream expects."""
+
+    def __init__(self, fileobj: BinaryIO):
+        self.fileobj = fileobj
+
+    async def read(self, n: int) -> bytes:
+        return self.fileobj.read(n)
+
+
+class TextArtifactWriter:
+    """Writes an extraction artifact incrementally, so its pages are never all held in memory.
+
+    Chunks are gzipped into a temporary file as they are written (or as they pass through
+    tee()); commit() stores the finished artifact under its key, and close() discards the
+    temporary file, so an artifact that was not committed is never visible.
+    """
+
+    def __init__(self, content_hash: str, parser_version: str = PARSER_VERSION, part: Tuple[int, int] | None = None):
+        self.key = artifact_key(content_hash, parser_version, part)
+        self.chunks = 0
+        self._file = tempfile.TemporaryFile(suffix=".jsonl.gz", dir=ARTIFACT_SPILL_DIR)
+        self._gzip = gzip.GzipFile(fileobj=self._file, mode="wb", compresslevel=6)
+
+    def write(self, chunk: TextChunk):
+        self._gzip.write((_encode_line(chunk) + "\n").encode("utf-8"))
+        self.chunks += 1
+
+    def write_all(self, chunks: Iterable[TextChunk]):
+        for chunk in chunks:
+            self.write(chunk)
+
+    def tee(self, chunks: Iterable[TextChunk]) -> Iterator[TextChunk]:
+        """Write each chunk of `chunks` while passing it on to the caller."""
+        for chunk in chunks:
+            self.write(chunk)
+            yield chunk
+
+    async def commit(self):
+        self._gzip.close()
+        size = self._file.tell()
+        self._file.seek(0)
+        if ARTIFACT_STORE == "local":
+            await asyncio.to_thread(_write_local_file, self.key, self._file)
+        else:
+            await upload_stream(_AsyncFileReader(self._file), f"{ARTIFACT_PREFIX}/{self.key}",
+                                bucket_name=_bucket(), content_type='application/gzip')
+        logger.info("Saved extraction artifact %s (%d chunks, %d bytes)", self.key, self.chunks, size)
+
+    def close(self):
+        self._file.close()
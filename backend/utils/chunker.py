@@ -0,0 +1,170 @@
+import os
+import re
+import logging
+from typing import Iterable, Iterator, List, NamedTuple
+
+from backend.models.document import TextChunk, TextSourceEnum
+from backend.utils.tokens import count_tokens, tokenize
+
+
+logger = logging.getLogger(__name__)
+
+# Target size of an indexed chunk, in approximate tokens (see backend.utils.tokens).
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", "256"))
+# Tokens repeated from the end of one chunk at the start of the next one.
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", "40"))
+# A heading only starts a new chunk when the current one already has this many tokens;
+# otherwise the heading is kept together with the preceding short text.
+CHUNK_MIN_TOKENS = int(os.getenv("CHUNK_MIN_TOKENS", "64"))
+
+_SENTENCE_SPLIT_RE = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[]?[A-Z0-9])")
+_NUMBERED_HEADING_RE = re.compile(r"^(\d+(\.\d+)*|[IVXLC]+\.|chapter\s+\d+|section\s+\d+)\s+\S", re.IGNORECASE)
+
+
+class _Unit(NamedTuple):
+    text: str
+    page_number: int
+    tokens: int
+    heading: bool
+    new_paragraph: bool
+
+
+def _is_heading(line: str) -> bool:
+    """Heuristic heading detection for a single line of extracted text."""
+    stripped = line.strip()
+    if not stripped or len(stripped) > 120 or stripped[-1] in ".,;:!?":
+        return False
+    if stripped.startswith("#") or _NUMBERED_HEADING_RE.match(stripped):
+        return True
+    words = stripped.split()
+    return len(words) <= 10 and (stripped.isupper() or all(w[:1].isupper() for w in words if w[:1].isalpha()))
+
+
+def _split_window(text: str, max_tokens: int) -> List[str]:
+    tokens = tokenize(text)
+    if len(tokens) <= max_tokens:
+        return [text]
+    return [
+        text[tokens[i].start():tokens[min(i + max_tokens, len(tokens)) - 1].end()]
+        for i in range(0, len(tokens), max_tokens)
+    ]
+
+
+def _units(chunk: TextChunk, max_tokens: int) -> Iterator[_Unit]:
+    """Split a page-level chunk into sentence and heading units."""
+    for paragraph in re.split(r"\n\s*\n|\n", chunk.text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if _is_heading(paragraph):
+            yield _Unit(paragraph, chunk.page_number, count_tokens(paragraph), True, True)
+            continue
+        first = True
+        for sentence in _SENTENCE_SPLIT_RE.split(paragraph):
+            for piece in _split_window(sentence, max_tokens):
+                yield _Unit(piece, chunk.page_number, count_tokens(piece), False, first)
+                first = False
+
+
+def _emit(units: List[_Unit], source: str) -> TextChunk:
+    parts = []
+    for idx, unit in enumerate(units):
+        if idx:
+            parts.append("\n" if unit.new_paragraph or units[idx - 1].heading else " ")
+        parts.append(unit.text)
+    return TextChunk(
+        text="".join(parts),
+        page_number=units[0].page_number,
+        page_end=units[-1].page_number,
+        source=source,
+    )
+
+
+def _split_table(chunk: TextChunk, max_tokens: int) -> Iterator[TextChunk]:
+    """Split an oversized markdown table by rows, repeating the header in every piece."""
+    lines = chunk.text.split("\n")
+    header, rows = lines[:2], lines[2:]
+    header_tokens = sum(count_tokens(l) for l in header)
+    current: List[str] = []
+    current_tokens = header_tokens
+    for row in rows:
+        n = count_tokens(row)
+        if current and current_tokens + n > max_tokens:
+            yield TextChunk(text="\n".join(header + current), page_number=chunk.page_number, page_end=chunk.page_number, source=chunk.source)
+            current, current_tokens = [], header_tokens
+        current.append(row)
+        current_tokens += n
+    if current or not rows:
+        yield TextChunk(text="\n".join(header + current), page_number=chunk.page_number, page_end=chunk.page_number, source=chunk.source)
+
+
+def chunk_text_chunks(
+    pages: Iterable[TextChunk],
+    max_tokens: int = CHUNK_MAX_TOKENS,
+    overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+    min_tokens: int = CHUNK_MIN_TOKENS,
+) -> Iterator[TextChunk]:
+    """Re-chunk page-level extraction output into token-bounded, overlapping index chunks.
+
+    Text is split at sentence boundaries and packed across pages until `max_tokens` is
+    reached; the last `overlap_tokens` worth of sentences are carried into the next
+    chunk. Headings start a new chunk (without overlap) so sections are not blended.
+    Tables are never merged with running text (the text before a table is emitted first,
+    so chunks stay in document order); oversized tables are split by rows.
+    Every emitted chunk records the page span it covers in `page_number`/`page_end`.
+
+    This is a generator: only the chunk currently being assembled is held in memory.
+    """
+    if overlap_tokens >= max_tokens:
+        raise ValueError("overlap_tokens must be smaller than max_tokens")
+
+    buffer: List[_Unit] = []
+    buffer_tokens = 0
+    fresh = 0  # units in the buffer that were not carried over from the previous chunk
+    buffer_source = TextSourceEnum.TEXT.value
+
+    for page in pages:
+        if not page.text or not page.text.strip():
+            continue
+
+        if page.source == TextSourceEnum.TABLE.value:
+            # Emit the text that precedes the table first, so chunks stay in document order
+            if fresh:
+                yield _emit(buffer, buffer_source)
+            buffer, buffer_tokens, fresh = [], 0, 0
+            if count_tokens(page.text) <= max_tokens:
+                yield TextChunk(text=page.text, page_number=page.page_number, page_end=page.page_number, source=page.source)
+            else:
+                yield from _split_table(page, max_tokens)
+            continue
+
+        for unit in _units(page, max_tokens):
+            if unit.heading and fresh and buffer_tokens >= min_tokens:
+                yield _emit(buffer, buffer_source)
+                buffer, buffer_tokens, fresh = [], 0, 0
+
+            if buffer and buffer_tokens + unit.tokens > max_tokens:
+                if fresh:
+                    yield _emit(buffer, buffer_source)
+                # Carry trailing sentences (never a trailing heading) into the next chunk,
+                # as long as they still leave room for the incoming unit
+                carried: List[_Unit] = []
+                carried_tokens = 0
+                for prev in reversed(buffer):
+                    if prev.heading or carried_tokens + prev.tokens > min(overlap_tokens, max_tokens - unit.tokens):
+                        break
+                    carried.insert(0, prev)
+                    carried_tokens += prev.tokens
+                buffer, buffer_tokens, fresh = carried, carried_tokens, 0
+
+            if not buffer:
+                buffer_source = page.source
+            elif page.source != buffer_source:
+                # Mixed TEXT/OCR content: label the chunk as OCR so it is not mistaken for clean text
+                buffer_source = TextSourceEnum.OCR.value
+            buffer.append(unit)
+            buffer_tokens += unit.tokens
+            fresh += 1
+
+    if fresh:
+        yield _emit(buffer, buffer_source)
@@ -0,0 +1,126 @@
+import asyncio
+import hashlib
+import logging
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from elasticsearch import Elasticsearch
+
+from backend.database import db
+from backend.models.document import ProcessingStatusEnum, generated_content_id
+from backend.utils.search import keyword_term
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# DynamoDB table mapping a SHA-256 of the uploaded file (`_id`) to the first document
+# that was fully processed from it.
+CONTENT_HASH_COLLECTION = "content_hashes"
+
+# Copies a chunk under a new owner: the new document/user ids are written into the
+# metadata and the _id is prefixed so the copy never overwrites the original chunk.
+_RETAG_SCRIPT = (
+    "ctx._id = params.document_id + ':' + ctx._id;"
+    "if (ctx._source.metadata == null) { ctx._source.metadata = [:]; }"
+    "ctx._source.metadata.document_id = params.document_id;"
+    "ctx._source.metadata.user_id = params.user_id;"
+    "if (ctx._source.containsKey('document_id')) { ctx._source.document_id = params.document_id; }"
+    "if (ctx._source.containsKey('user_id')) { ctx._source.user_id = params.user_id; }"
+)
+
+
+def sha256_digest(data) -> str:
+    """Hex SHA-256 of a bytes-like object (bytes, bytearray or memoryview)."""
+    return hashlib.sha256(data).hexdigest()
+
+
+async def find_canonical(content_hash: str) -> Optional[Dict[str, Any]]:
+    """Return the completed document previously processed from identical content, if any."""
+    if not content_hash:
+        return None
+    entry = await db.get_collection(CONTENT_HASH_COLLECTION).find_one({"_id": content_hash})
+    if not entry:
+        return None
+    canonical = await db.get_collection("documents").find_one({"_id": entry["document_id"]})
+    if not canonical or canonical.get("processing_status") != ProcessingStatusEnum.COMPLETED.value:
+        # Stale entry (document deleted or reprocessing); treat the upload as new content
+        return None
+    return canonical
+
+
+async def register_canonical(content_hash: str, document_id: str, user_id: str, s3_key: str):
+    """Record `document_id` as the canonical processed copy of `content_hash` unless one exists."""
+    if not content_hash:
+        return
+    hashes = db.get_collection(CONTENT_HASH_COLLECTION)
+    if await hashes.find_one({"_id": content_hash}):
+        return
+    await hashes.insert_one({
+        "_id": content_hash,
+        "document_id": document_id,
+        "user_id": user_id,
+        "s3_key": s3_key,
+        "created_at": datetime.utcnow(),
+    })
+    logger.info("Registered %s as canonical document for content %s", document_id, content_hash)
+
+
+def _retag_vectors(source_document_id: str, document_id: str, user_id: str,
+                   es_host: str, es_index_name: str) -> int:
+    """Copy the indexed chunks of one document to another owner with a server-side reindex."""
+    es = Elasticsearch(hosts=[es_host])
+    if not es.indices.exists(index=es_index_name):
+        return 0
+    resp = es.reindex(
+        body={
+            "source": {
+                "index": es_index_name,
+                "query": keyword_term("metadata.document_id", source_document_id),
+            },
+            "dest": {"index": es_index_name},
+            "script": {"lang": "painless", "source": _RETAG_SCRIPT,
+                       "params": {"document_id": document_id, "user_id": user_id}},
+        },
+        refresh=True,
+        wait_for_completion=True,
+    )
+    failures = resp.get("failures") or []
+    if failures:
+        raise RuntimeError(f"Re-tagging vectors failed for {len(failures)} chunks: {failures[0]}")
+    return int(resp.get("created", 0)) + int(resp.get("updated", 0))
+
+
+async def clone_document(
+    canonical: Dict[str, Any],
+    document_id: str,
+    user_id: str,
+    es_host: str = "http://localhost:9200",
+    es_index_name: str = "pdf_chunks",
+) -> Dict[str, int]:
+    """Give `document_id` the processing results of an identical, already processed document.
+
+    Generated content is copied to the new owner and the indexed chunk vectors are
+    re-tagged in Elasticsearch, so neither extraction, embedding nor the LLM run again.
+    The caller is responsible for marking the document COMPLETED.
+    """
+    source_id = canonical["_id"]
+    gen_collection = db.get_collection("generated_content")
+
+    copies = [
+        {
+            "_id": generated_content_id(document_id, item.get("content_type")),
+            "document_id": document_id,
+            "user_id": user_id,
+            "content_type": item.get("content_type"),
+            "content_data": item.get("content_data", {}),
+            "created_at": datetime.utcnow(),
+        }
+        async for item in gen_collection.find({"document_id": source_id})
+    ]
+    await gen_collection.insert_many(copies)
+    copied = len(copies)
+
+    chunks = await asyncio.to_thread(_retag_vectors, source_id, document_id, user_id, es_host, es_index_name)
+    logger.info("Cloned %s from %s: %d generated items, %d indexed chunks", document_id, source_id, copied, chunks)
+    return {"generated_items": copied, "chunks": chunks}
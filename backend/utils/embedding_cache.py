@@ -0,0 +1,184 @@
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional
+
+import numpy as np
+from dotenv import load_dotenv
+load_dotenv()  # Load environment variables from .env file
+try:
+    import redis
+except Exception:
+    redis = None
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# "redis" (shared across workers, with the in-process tier in front), "memory" (in-process only) or "off".
+EMBEDDING_CACHE = os.getenv("EMBEDDING_CACHE", "redis").lower()
+EMBEDDING_CACHE_URL = os.getenv("EMBEDDING_CACHE_URL") or os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
+# Lifetime of a cached vector in Redis. Size is bounded by the TTL plus the Redis
+# instance's maxmemory with an LRU eviction policy (allkeys-lru).
+EMBEDDING_CACHE_TTL_SECONDS = int(os.getenv("EMBEDDING_CACHE_TTL_SECONDS", str(30 * 24 * 3600)))
+# Vectors kept in the per-process LRU tier (768 float32 dims = 3 KB each).
+EMBEDDING_CACHE_LOCAL_ENTRIES = int(os.getenv("EMBEDDING_CACHE_LOCAL_ENTRIES", "20000"))
+
+_STATS_KEY = "emb:stats"
+
+
+def fleet_stats() -> Optional[Dict[str, object]]:
+    """Hit/miss counters summed over every worker sharing the Redis cache, or None without Redis."""
+    if EMBEDDING_CACHE != "redis" or redis is None:
+        return None
+    client = redis.Redis.from_url(EMBEDDING_CACHE_URL)
+    try:
+        return _read_fleet_stats(client)
+    except Exception as e:
+        logger.warning("Could not read fleet embedding cache stats: %s", e)
+        return None
+    finally:
+        client.close()
+
+
+def _read_fleet_stats(client) -> Dict[str, object]:
+    fleet: Dict[str, object] = {k.decode(): int(v) for k, v in client.hgetall(_STATS_KEY).items()}
+    total = fleet.get("hits", 0) + fleet.get("misses", 0)
+    fleet["hit_rate"] = round(fleet.get("hits", 0) / total, 4) if total else 0.0
+    return fleet
+
+
+def text_key(model_name: str, text: str) -> str:
+    return f"emb:{model_name}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+
+class _LocalLRU:
+    """Thread-safe, size-bounded LRU of float32 vectors."""
+
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._items: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            vec = self._items.get(key)
+            if vec is not None:
+                self._items.move_to_end(key)
+            return vec
+
+    def put(self, key: str, vec: np.ndarray):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._items[key] = vec
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_entries:
+                self._items.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+class CachedEmbeddings:
+    """Embeddings wrapper that looks vectors up by (model, text hash) before encoding.
+
+    Lookups go to the in-process LRU first, then to Redis (one MGET per batch); only the
+    remaining texts are encoded, each distinct text once, and the new vectors are written
+    back to both tiers. A Redis outage degrades to the in-process tier. Query embeddings
+    are passed through uncached.
+    """
+
+    def __init__(self, embeddings, model_name: str, backend: str = EMBEDDING_CACHE):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self._local = _LocalLRU(EMBEDDING_CACHE_LOCAL_ENTRIES)
+        self._redis = None
+        if backend == "redis":
+            if redis is None:
+                logger.warning("redis package not installed; embedding cache is in-process only")
+            else:
+                self._redis = redis.Redis.from_url(EMBEDDING_CACHE_URL)
+        self._stats_lock = threading.Lock()
+        self._stats = {"local_hits": 0, "redis_hits": 0, "misses": 0}
+
+    def __getattr__(self, name):
+        # Behave like the wrapped embeddings object for everything else
+        return getattr(self.embeddings, name)
+
+    def _redis_get(self, keys: List[str]) -> List[Optional[bytes]]:
+        if self._redis is None or not keys:
+            return [None] * len(keys)
+        try:
+            return self._redis.mget(keys)
+        except Exception as e:
+            logger.warning("Embedding cache lookup failed: %s", e)
+            return [None] * len(keys)
+
+    def _redis_put(self, items: Dict[str, np.ndarray], hits: int):
+        if self._redis is None:
+            return
+        try:
+            pipe = self._redis.pipeline(transaction=False)
+            for key, vec in items.items():
+                pipe.set(key, vec.tobytes(), ex=EMBEDDING_CACHE_TTL_SECONDS)
+            # Fleet-wide counters, so hit rates can be read across all workers
+            pipe.hincrby(_STATS_KEY, "hits", hits)
+            pipe.hincrby(_STATS_KEY, "misses", len(items))
+            pipe.execute()
+        except Exception as e:
+            logger.warning("Embedding cache write failed: %s", e)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [text_key(self.model_name, t) for t in texts]
+        vectors: List[Optional[np.ndarray]] = [self._local.get(k) for k in keys]
+        local_hits = sum(v is not None for v in vectors)
+
+        missing = [i for i, v in enumerate(vectors) if v is None]
+        redis_hits = 0
+        for i, raw in zip(missing, self._redis_get([keys[i] for i in missing])):
+            if raw is not None:
+                vectors[i] = np.frombuffer(raw, dtype=np.float32)
+                self._local.put(keys[i], vectors[i])
+                redis_hits += 1
+
+        # Encode each distinct missing text once
+        to_encode: Dict[str, int] = {}
+        for i, v in enumerate(vectors):
+            if v is None and keys[i] not in to_encode:
+                to_encode[keys[i]] = i
+        new: Dict[str, np.ndarray] = {}
+        if to_encode:
+            encoded = self.embeddings.embed_documents([texts[i] for i in to_encode.values()])
+            for key, vec in zip(to_encode, encoded):
+                new[key] = np.asarray(vec, dtype=np.float32)
+                self._local.put(key, new[key])
+            for i, v in enumerate(vectors):
+                if v is None:
+                    vectors[i] = new[keys[i]]
+
+        with self._stats_lock:
+            self._stats["local_hits"] += local_hits
+            self._stats["redis_hits"] += redis_hits
+            self._stats["misses"] += len(new)
+        self._redis_put(new, local_hits + redis_hits)
+        return [v.tolist() for v in vectors]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embeddings.embed_query(text)
+
+    def stats(self) -> Dict[str, object]:
+        """Hit/miss counters of this process, plus fleet-wide counters when Redis is used."""
+        with self._stats_lock:
+            stats: Dict[str, object] = dict(self._stats)
+        lookups = stats["local_hits"] + stats["redis_hits"] + stats["misses"]
+        stats["hit_rate"] = round((stats["local_hits"] + stats["redis_hits"]) / lookups, 4) if lookups else 0.0
+        stats["local_entries"] = len(self._local)
+        if self._redis is not None:
+            try:
+                stats["fleet"] = _read_fleet_stats(self._redis)
+            except Exception as e:
+                logger.warning("Could not read fleet embedding cache stats: %s", e)
+        return stats
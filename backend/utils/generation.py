@@ -0,0 +1,236 @@
+import os
+import logging
+import itertools
+from typing import Any, Callable, Iterable, List, Tuple
+
+from langchain.output_parsers import PydanticOutputParser
+from langchain.prompts import PromptTemplate
+from langchain_core.runnables import RunnableParallel
+
+from backend.models.document import TextChunk, Summary, MindMapNode, FlashcardList
+from backend.utils.tokens import count_tokens, tokenize
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Approximate token budget for the document text placed in a single LLM prompt.
+# Documents that fit are generated in one pass; larger ones go through map-reduce.
+GENERATION_SECTION_TOKENS = int(os.getenv("GENERATION_SECTION_TOKENS", "6000"))
+# How many section prompts may be in flight at once during the map and reduce phases.
+GENERATION_MAX_CONCURRENCY = int(os.getenv("GENERATION_MAX_CONCURRENCY", "4"))
+# Upper bound on flashcards kept after merging the per-section decks.
+GENERATION_MAX_FLASHCARDS = int(os.getenv("GENERATION_MAX_FLASHCARDS", "40"))
+
+
+SUMMARY_TEMPLATE = (
+    "You are an expert tutor. Produce a concise summary of the following document text.\n"
+    "Follow the output schema exactly.\n\n{format_instructions}\n\nDocument Text:\n{document_text}"
+)
+MINDMAP_TEMPLATE = (
+    "Create a hierarchical mind map of the key topics in the following document text. Output must conform to the MindMapNode Pydantic model.\n\n{format_instructions}\n\nDocument Text:\n{document_text}"
+)
+FLASHCARDS_TEMPLATE = (
+    "Generate a list of concise flashcards (term + definition) from the following document text. Output must conform to the FlashcardList model.\n\n{format_instructions}\n\nDocument Text:\n{document_text}"
+)
+
+# Reduce prompts combine partial results produced from consecutive sections of one document
+REDUCE_SUMMARY_TEMPLATE = (
+    "You are an expert tutor. The following are summaries of consecutive sections of a single document, in order.\n"
+    "Combine them into one concise, coherent summary of the whole document without repeating points.\n"
+    "Follow the output schema exactly.\n\n{format_instructions}\n\nSection Summaries:\n{document_text}"
+)
+REDUCE_MINDMAP_TEMPLATE = (
+    "The following are mind map outlines of consecutive sections of a single document, in order.\n"
+    "Merge them into one hierarchical mind map of the whole document: pick a single root topic, "
+    "combine overlapping branches and keep the most important sub-topics. Output must conform to the MindMapNode Pydantic model.\n\n"
+    "{format_instructions}\n\nSection Outlines:\n{document_text}"
+)
+
+
+def _build_chain(llm, template: str, model):
+    """Build a prompt | llm | parser chain whose only input variable is `document_text`."""
+    parser = PydanticOutputParser(pydantic_object=model)
+    # format_instructions is bound as a partial variable so braces inside the schema are not re-interpreted
+    prompt = PromptTemplate(
+        template=template,
+        input_variables=["document_text"],
+        partial_variables={"format_instructions": parser.get_format_instructions()},
+    )
+    return prompt | llm | parser
+
+
+def _split_oversized(text: str, max_tokens: int) -> List[str]:
+    """Split a single text that is larger than `max_tokens` into consecutive token windows."""
+    tokens = tokenize(text)
+    if len(tokens) <= max_tokens:
+        return [text]
+    pieces = []
+    for start in range(0, len(tokens), max_tokens):
+        window = tokens[start:start + max_tokens]
+        pieces.append(text[window[0].start():window[-1].end()])
+    return pieces
+
+
+def _pack(texts: Iterable[str], max_tokens: int) -> List[List[str]]:
+    """Greedily group consecutive texts so that each group stays within `max_tokens`."""
+    groups: List[List[str]] = []
+    current: List[str] = []
+    current_tokens = 0
+    for text in texts:
+        n = count_tokens(text)
+        if current and current_tokens + n > max_tokens:
+            groups.append(current)
+            current, current_tokens = [], 0
+        current.append(text)
+        current_tokens += n
+    if current:
+        groups.append(current)
+    return groups
+
+
+def split_into_sections(text_chunks: Iterable[TextChunk], max_tokens: int = GENERATION_SECTION_TOKENS) -> List[str]:
+    """Split extracted chunks into token-bounded sections, keeping page order.
+
+    Chunks are packed together until the budget is reached; a chunk that is larger
+    than the budget on its own is cut into consecutive token windows.
+    """
+    pieces = []
+    for chunk in text_chunks:
+        text = chunk.text if hasattr(chunk, 'text') else str(chunk)
+        if not text or not text.strip():
+            continue
+        pieces.extend(_split_oversized(text, max_tokens))
+    return ["\n\n".join(group) for group in _pack(pieces, max_tokens)]
+
+
+def _batch(chain, texts: List[str]) -> List[Any]:
+    return chain.batch(
+        [{"document_text": t} for t in texts],
+        config={"max_concurrency": GENERATION_MAX_CONCURRENCY},
+    )
+
+
+def _truncate(text: str, max_tokens: int) -> str:
+    """Cut `text` down to its first `max_tokens` tokens."""
+    tokens = tokenize(text)
+    if len(tokens) <= max_tokens:
+        return text
+    return text[:tokens[max_tokens - 1].end()]
+
+
+def _reduce(chain, parts: List[str], render: Callable[[Any], str], max_tokens: int):
+    """Hierarchically reduce `parts` with `chain` until they fit into a single prompt.
+
+    Each level packs the parts into token-bounded groups and reduces the groups in
+    parallel; the rendered results become the parts of the next level. A part larger
+    than the budget is split into token windows first. When no two neighbouring parts
+    fit together, they are reduced pairwise with each cut to half the budget, so every
+    level shrinks the number of parts and no prompt exceeds `max_tokens`.
+    """
+    if max_tokens < 2:
+        raise ValueError(f"Reduce token budget must be at least 2 tokens, got {max_tokens}")
+    parts = [piece for part in parts for piece in _split_oversized(part, max_tokens)]
+    level = 0
+    while True:
+        groups = _pack(parts, max_tokens)
+        if len(groups) <= 1:
+            return chain.invoke({"document_text": "\n\n".join(parts)})
+        if len(groups) == len(parts):
+            # Grouping can no longer shrink the input; fall back to pairs trimmed to fit
+            half = max_tokens // 2
+            groups = [[_truncate(p, half) for p in parts[i:i + 2]] for i in range(0, len(parts), 2)]
+        level += 1
+        logger.info("Reduce level %d: %d parts -> %d groups", level, len(parts), len(groups))
+        results = _batch(chain, ["\n\n".join(g) for g in groups])
+        parts = []
+        for r in results:
+            text = render(r)
+            if count_tokens(text) > max_tokens:
+                logger.warning("Reduce level %d produced a part over %d tokens; truncating it", level, max_tokens)
+                text = _truncate(text, max_tokens)
+            parts.append(text)
+
+
+def _outline(node: MindMapNode, depth: int = 0) -> str:
+    """Render a MindMapNode tree as an indented bullet outline."""
+    lines = ["  " * depth + "- " + node.topic]
+    for child in node.children:
+        lines.append(_outline(child, depth + 1))
+    return "\n".join(lines)
+
+
+def _merge_flashcards(decks: List[FlashcardList], limit: int = GENERATION_MAX_FLASHCARDS) -> FlashcardList:
+    """Merge per-section decks, dropping repeated terms.
+
+    Cards are interleaved round-robin across sections so that every section is
+    represented when the merged deck is capped at `limit`.
+    """
+    seen = set()
+    per_deck = []
+    for deck in decks:
+        unique = []
+        for card in deck.flashcards:
+            key = " ".join(card.term.lower().split())
+            if not key or key in seen:
+                continue
+            seen.add(key)
+            unique.append(card)
+        per_deck.append(unique)
+
+    merged = []
+    for row in itertools.zip_longest(*per_deck):
+        merged.extend(card for card in row if card is not None)
+    return FlashcardList(flashcards=merged[:limit])
+
+
+def generate_content(text_chunks: List[TextChunk], llm, max_section_tokens: int = GENERATION_SECTION_TOKENS) -> Tuple[dict, dict, dict]:
+    """Generate the summary, mind map and flashcards for a document.
+
+    Short documents are sent to the LLM in a single prompt per content type. Longer
+    documents are split into token-bounded sections that are summarized, outlined and
+    turned into flashcards in parallel (map), after which the partial results are
+    combined into the final Summary, MindMapNode and FlashcardList (reduce).
+
+    Returns a tuple of (summary_json, mind_json, flash_json) dicts.
+    """
+    summary_chain = _build_chain(llm, SUMMARY_TEMPLATE, Summary)
+    mind_chain = _build_chain(llm, MINDMAP_TEMPLATE, MindMapNode)
+    flash_chain = _build_chain(llm, FLASHCARDS_TEMPLATE, FlashcardList)
+    per_section = RunnableParallel(summary=summary_chain, mindmap=mind_chain, flashcards=flash_chain)
+
+    sections = split_into_sections(text_chunks, max_section_tokens)
+    if len(sections) <= 1:
+        logger.info("Document fits in a single prompt; generating in one pass")
+        result = per_section.invoke({"document_text": sections[0] if sections else ""})
+        return result["summary"].dict(), result["mindmap"].dict(), result["flashcards"].dict()
+
+    # MAP: every section produces a partial summary, outline and deck
+    logger.info("Map phase: %d sections (max %d tokens each, concurrency=%d)", len(sections), max_section_tokens, GENERATION_MAX_CONCURRENCY)
+    partials = _batch(per_section, sections)
+    logger.info("Map phase complete for %d sections", len(partials))
+
+    # REDUCE
+    reduce_summary_chain = _build_chain(llm, REDUCE_SUMMARY_TEMPLATE, Summary)
+    reduce_mind_chain = _build_chain(llm, REDUCE_MINDMAP_TEMPLATE, MindMapNode)
+
+    summary_result = _reduce(
+        reduce_summary_chain,
+        [p["summary"].summary for p in partials],
+        lambda r: r.summary,
+        max_section_tokens,
+    )
+    logger.info("SUMMARY reduce complete")
+
+    mind_result = _reduce(
+        reduce_mind_chain,
+        [_outline(p["mindmap"]) for p in partials],
+        _outline,
+        max_section_tokens,
+    )
+    logger.info("MINDMAP reduce complete")
+
+    flash_result = _merge_flashcards([p["flashcards"] for p in partials])
+    logger.info("FLASHCARDS merge complete: %d cards", len(flash_result.flashcards))
+
+    return summary_result.dict(), mind_result.dict(), flash_result.dict()
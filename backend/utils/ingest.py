@@ -0,0 +1,198 @@
+import os
+import uuid
+import queue
+import contextlib
+import logging
+import threading
+from typing import Any, Iterable, List, NamedTuple
+
+from backend.models.document import TextChunk
+from backend.utils.chunker import chunk_text_chunks
+from backend.utils.embedding_cache import CachedEmbeddings
+from backend.utils.search import DEFAULT_EMBEDDING_MODEL, chunk_id, get_embeddings, get_index_client
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Index chunks buffered between extraction and embedding.
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "256"))
+# Chunks embedded per model call (and written per Elasticsearch request).
+INGEST_EMBED_BATCH_SIZE = int(os.getenv("INGEST_EMBED_BATCH_SIZE", "64"))
+# Embedded batches buffered between embedding and the Elasticsearch writer.
+INGEST_WRITE_QUEUE_BATCHES = int(os.getenv("INGEST_WRITE_QUEUE_BATCHES", "4"))
+
+_DONE = object()
+
+
+class IngestResult(NamedTuple):
+    chunks: int                  # index chunks embedded
+    indexed: int                 # chunks successfully written to Elasticsearch
+    index_errors: int            # chunks that could not be written
+
+
+def _put(q: "queue.Queue", item: Any, stop: threading.Event) -> bool:
+    """Blocking put that gives up once `stop` is set. Returns False if it gave up."""
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _metadata(chunk: TextChunk, index: int, document_id: str, user_id: str, ingest_run: str) -> dict:
+    return {
+        "document_id": document_id,
+        "user_id": user_id,
+        # Position of the chunk in the document, so indexed chunks can be read back in order
+        "chunk_index": index,
+        # Identifies the ingest that wrote the chunk; chunks of earlier runs are deleted afterwards
+        "ingest_run": ingest_run,
+        "page_number": chunk.page_number,
+        "page_end": chunk.page_end if chunk.page_end is not None else chunk.page_number,
+        "source": chunk.source,
+    }
+
+
+def ingest_chunks(
+    pages: Iterable[TextChunk],
+    document_id: str,
+    user_id: str,
+    model_name: str = DEFAULT_EMBEDDING_MODEL,
+    es_host: str = "http://localhost:9200",
+    es_index_name: str = "pdf_chunks",
+    batch_size: int = INGEST_EMBED_BATCH_SIZE,
+    suspend_refresh: bool = False,
+) -> IngestResult:
+    """Chunk, embed and index a stream of page-level chunks as a three-stage pipeline.
+
+    A producer thread pulls pages from `pages` (the extraction artifact) through the
+    index chunker into a bounded queue; the calling thread embeds them in batches; a
+    writer thread pushes each embedded batch to Elasticsearch. Chunking, embedding and
+    indexing therefore overlap, the queues bound how much work is in flight, and chunks
+    become searchable while later ones are still being embedded.
+
+    Each embedded batch is written with native bulk requests (see
+    ElasticsearchClient.bulk_index); with `suspend_refresh` the index refresh is turned
+    off for the whole ingest, which is worth it for very large documents. Chunk ids are
+    deterministic (see chunk_id), so re-ingesting a document overwrites its chunks, and
+    chunks left over from earlier runs are deleted once every chunk has been written.
+
+    Embedded batches are handed to the writer and then dropped, so memory stays bounded by
+    the queues however large the document is; the vectors are read back from the index
+    when they are needed again (see fetch_document_chunks).
+
+    Extraction and embedding errors are raised. Indexing stays best-effort, as before:
+    chunks that could not be written are logged and counted in the result.
+    """
+    chunk_q: "queue.Queue" = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+    write_q: "queue.Queue" = queue.Queue(maxsize=INGEST_WRITE_QUEUE_BATCHES)
+    stop = threading.Event()
+    ingest_run = uuid.uuid4().hex
+    errors: List[BaseException] = []
+    counters = {"indexed": 0, "index_errors": 0}
+
+    embeddings = get_embeddings(model_name)
+    es = None
+    try:
+        es = get_index_client(es_host=es_host, es_index_name=es_index_name)
+    except Exception as es_err:
+        logger.exception("Elasticsearch unavailable for %s; chunks will not be indexed: %s", document_id, es_err)
+
+    def produce():
+        try:
+            for chunk in chunk_text_chunks(pages):
+                if not chunk.text or not chunk.text.strip():
+                    continue
+                if not _put(chunk_q, chunk, stop):
+                    return
+        except BaseException as e:
+            errors.append(e)
+        finally:
+            _put(chunk_q, _DONE, stop)
+
+    def write():
+        while True:
+            item = write_q.get()
+            if item is _DONE:
+                return
+            texts, vectors, metadatas, ids = item
+            if es is None:
+                counters["index_errors"] += len(texts)
+                continue
+            try:
+                result = es.bulk_index(es_index_name, texts, vectors, metadatas, ids=ids)
+                counters["indexed"] += result.indexed
+                counters["index_errors"] += len(result.errors)
+            except Exception as idx_err:
+                # Keep draining the queue so the embedding stage never blocks on a dead writer
+                counters["index_errors"] += len(texts)
+                logger.exception("Indexing a batch of %d chunks failed for %s: %s", len(texts), document_id, idx_err)
+
+    producer = threading.Thread(target=produce, name=f"ingest-extract-{document_id}", daemon=True)
+    writer = threading.Thread(target=write, name=f"ingest-index-{document_id}", daemon=True)
+
+    batch: List[TextChunk] = []
+    embedded = 0
+
+    def flush():
+        nonlocal embedded
+        texts = [c.text for c in batch]
+        vectors = embeddings.embed_documents(texts)
+        start = embedded
+        embedded += len(batch)
+        write_q.put((
+            texts,
+            vectors,
+            [_metadata(c, start + i, document_id, user_id, ingest_run) for i, c in enumerate(batch)],
+            [chunk_id(document_id, c.page_number, start + i, c.text) for i, c in enumerate(batch)],
+        ))
+        batch.clear()
+
+    suspend = es is not None and suspend_refresh
+    # A suspended refresh is restored (and the index refreshed once) when the block exits
+    with es.suspended_refresh(es_index_name) if suspend else contextlib.nullcontext():
+        producer.start()
+        writer.start()
+        try:
+            while True:
+                item = chunk_q.get()
+                if item is _DONE:
+                    break
+                batch.append(item)
+                if len(batch) >= batch_size:
+                    flush()
+            if errors:
+                raise errors[0]
+            if batch:
+                flush()
+        finally:
+            stop.set()
+            write_q.put(_DONE)
+            writer.join()
+            producer.join()
+
+    if es is not None and counters["indexed"] and not suspend:
+        try:
+            # Make the tail of the document searchable immediately instead of after the refresh interval
+            es.client.indices.refresh(index=es_index_name)
+        except Exception as refresh_err:
+            logger.warning("Index refresh failed for %s: %s", es_index_name, refresh_err)
+
+    if es is not None and not counters["index_errors"]:
+        # Unchanged chunks were overwritten in place (deterministic ids); whatever an earlier
+        # run wrote that this one did not is stale. Kept when this run was incomplete.
+        try:
+            es.delete_stale_chunks(es_index_name, document_id, ingest_run)
+        except Exception as del_err:
+            logger.warning("Could not delete stale chunks of %s: %s", document_id, del_err)
+
+    if isinstance(embeddings, CachedEmbeddings):
+        logger.info("Embedding cache after %s: %s", document_id, embeddings.stats())
+
+    logger.info("Ingested %s: %d chunks embedded, %d indexed, %d failed",
+                document_id, embedded, counters["indexed"], counters["index_errors"])
+    return IngestResult(chunks=embedded, indexed=counters["indexed"], index_errors=counters["index_errors"])
+
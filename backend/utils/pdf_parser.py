@@ -1,122 +1,500 @@
+import io
+import os
+import mmap
+import queue
 import logging
-from typing import List
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Tuple, Union
 from dotenv import load_dotenv 
 load_dotenv()  # Load environment variables from .env file
 import fitz  # PyMuPDF
 from PIL import Image
 import pytesseract
+try:
+    # In-process Tesseract bindings; optional, the pytesseract subprocess path is the fallback
+    import tesserocr
+except Exception:
+    tesserocr = None
 
 from backend.models.document import TextChunk, TextSourceEnum
 
 
 logger = logging.getLogger(__name__)
 
+# Number of processes used for parallel page extraction (0 = one per CPU core).
+PDF_EXTRACT_WORKERS = int(os.getenv("PDF_EXTRACT_WORKERS", "0"))
+# Documents with fewer pages than this are always extracted serially; process
+# start-up and re-opening the PDF would cost more than it saves.
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "24"))
+# Each worker receives several small page ranges so slow (OCR) pages are spread out.
+PDF_RANGES_PER_WORKER = int(os.getenv("PDF_RANGES_PER_WORKER", "4"))
+# Start method of the extraction processes. "forkserver" is safe in processes that also
+# run threads or have torch loaded (forking those can deadlock the children); a small
+# in-memory PDF is then pickled once per worker process, while a spilled one (SpilledPdf)
+# is mapped by each worker from the spill file. "fork" shares the buffer through
+# copy-on-write memory instead and is fine for dedicated, single-threaded extract workers.
+PDF_EXTRACT_START_METHOD = os.getenv("PDF_EXTRACT_START_METHOD", "forkserver")
+
+# OCR engine selection: "auto" (tesserocr when installed), "tesserocr" or "pytesseract".
+OCR_ENGINE = os.getenv("OCR_ENGINE", "auto").lower()
+# Resolution pages are rendered at for OCR, and Tesseract's page segmentation mode.
+OCR_DPI = int(os.getenv("OCR_DPI", "200"))
+OCR_PSM = int(os.getenv("OCR_PSM", "3"))
+OCR_LANG = os.getenv("OCR_LANG", "eng")
+# Maximum number of persistent Tesseract handles per process (one per concurrently OCR-ing thread).
+OCR_POOL_SIZE = int(os.getenv("OCR_POOL_SIZE", "2"))
+
+# Identifies the extraction output format. Bump it whenever a change here alters the
+# TextChunks produced for the same PDF, so stored extraction artifacts are not reused.
+PARSER_VERSION = "1"
+
 
 def _pixmap_to_pil(pix) -> Image.Image:
-    mode = "RGB" if pix.n < 4 else "RGBA"
+    if pix.n == 1:
+        mode = "L"
+    else:
+        mode = "RGB" if pix.n < 4 else "RGBA"
     img = Image.frombytes(mode, [pix.width, pix.height], pix.samples)
     return img
 
 
-def extract_text_from_pdf(file_path: str) -> List[TextChunk]:
-    """Extract text from PDF using a hybrid strategy: direct text extraction first, then OCR fallback for image pages.
+class OcrEngine:
+    """Recognizes the text of a rendered page (a fitz.Pixmap)."""
+
+    name = "base"
+
+    def recognize(self, pix) -> str:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PytesseractEngine(OcrEngine):
+    """Runs the `tesseract` binary once per page through pytesseract (subprocess + temp files)."""
+
+    name = "pytesseract"
+
+    def __init__(self, lang: str = OCR_LANG, psm: int = OCR_PSM, dpi: int = OCR_DPI):
+        self.lang = lang
+        self.config = f"--psm {psm} --dpi {dpi}"
+
+    def recognize(self, pix) -> str:
+        return pytesseract.image_to_string(_pixmap_to_pil(pix), lang=self.lang, config=self.config)
+
+
+class TesserocrEngine(OcrEngine):
+    """Keeps initialized Tesseract API handles alive for the lifetime of the process.
+
+    Handles are created lazily up to `pool_size` and handed out through a thread-safe
+    queue; the raw pixmap samples are passed to Tesseract directly, without encoding
+    an image file. If recognition fails the page is retried with the subprocess engine.
+    """
+
+    name = "tesserocr"
+
+    def __init__(self, pool_size: int = OCR_POOL_SIZE, lang: str = OCR_LANG, psm: int = OCR_PSM, dpi: int = OCR_DPI):
+        if tesserocr is None:
+            raise RuntimeError("tesserocr is not installed")
+        self.pool_size = max(1, pool_size)
+        self.lang = lang
+        self.psm = psm
+        self.dpi = dpi
+        self._idle: "queue.Queue" = queue.Queue()
+        self._created = 0
+        self._lock = threading.Lock()
+        self._fallback = PytesseractEngine(lang=lang, psm=psm, dpi=dpi)
+        # Create the first handle eagerly so a broken installation is detected up front
+        self._idle.put(self._new_api())
+
+    def _new_api(self):
+        api = tesserocr.PyTessBaseAPI(lang=self.lang, psm=self.psm)
+        self._created += 1
+        return api
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self._lock:
+            if self._created < self.pool_size:
+                return self._new_api()
+        return self._idle.get()
+
+    def recognize(self, pix) -> str:
+        api = self._acquire()
+        try:
+            api.SetImageBytes(pix.samples, pix.width, pix.height, pix.n, pix.stride)
+            api.SetSourceResolution(self.dpi)
+            return api.GetUTF8Text()
+        except Exception as ocr_err:
+            logger.warning("tesserocr recognition failed (%s); falling back to pytesseract", ocr_err)
+            return self._fallback.recognize(pix)
+        finally:
+            api.Clear()
+            self._idle.put(api)
+
+    def close(self):
+        while True:
+            try:
+                api = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            api.End()
+            self._created -= 1
+
+
+_ocr_engine: OcrEngine | None = None
+_ocr_engine_pid: int | None = None
+_ocr_engine_lock = threading.Lock()
 
-    Returns a list of TextChunk objects (one per page with extracted text and source).
+
+def _create_ocr_engine() -> OcrEngine:
+    if OCR_ENGINE in ("auto", "tesserocr"):
+        if tesserocr is not None:
+            try:
+                return TesserocrEngine()
+            except Exception as init_err:
+                logger.warning("Could not initialize tesserocr (%s); using pytesseract", init_err)
+        elif OCR_ENGINE == "tesserocr":
+            logger.warning("OCR_ENGINE=tesserocr but tesserocr is not installed; using pytesseract")
+    return PytesseractEngine()
+
+
+def get_ocr_engine() -> OcrEngine:
+    """Return this process's OCR engine, creating it on first use.
+
+    Engines are per process: a forked extraction worker never reuses handles created
+    by its parent.
+    """
+    global _ocr_engine, _ocr_engine_pid
+    with _ocr_engine_lock:
+        if _ocr_engine is None or _ocr_engine_pid != os.getpid():
+            _ocr_engine = _create_ocr_engine()
+            _ocr_engine_pid = os.getpid()
+            logger.info("Using OCR engine %s (dpi=%d, psm=%d)", _ocr_engine.name, OCR_DPI, OCR_PSM)
+        return _ocr_engine
+
+
+def _ocr_page(page) -> str:
+    """Render `page` as an 8-bit grayscale pixmap and OCR it."""
+    pix = page.get_pixmap(dpi=OCR_DPI, colorspace=fitz.csGRAY, alpha=False)
+    return get_ocr_engine().recognize(pix)
+
+
+# A PDF given by path, or held in memory (bytes, a memoryview over an mmap'd spill file, BytesIO)
+PdfSource = Union[str, os.PathLike, bytes, bytearray, memoryview, io.BytesIO]
+
+
+class SpilledPdf(mmap.mmap):
+    """Read-only mapping of a PDF spilled to a (possibly already unlinked) temporary file.
+
+    Pass `memoryview(SpilledPdf(f))` as the PdfSource. Extraction workers that are not
+    forked re-map the file through `/proc/<pid>/fd/<fd>` instead of receiving a pickled
+    copy of it, so the file must stay open while the PDF is being extracted.
+    """
+
+    def __new__(cls, fileobj):
+        self = super().__new__(cls, fileobj.fileno(), 0, access=mmap.ACCESS_READ)
+        self.path = f"/proc/{os.getpid()}/fd/{fileobj.fileno()}"
+        return self
+
+
+class _SpillRef:
+    """Picklable stand-in for a SpilledPdf, sent to extraction workers in its place."""
+
+    def __init__(self, path: str):
+        self.path = path
+
+
+def _open_pdf(source: PdfSource):
+    """Open a PdfSource with PyMuPDF; in-memory sources are opened with fitz.open(stream=...)."""
+    if isinstance(source, (str, os.PathLike)):
+        return fitz.open(source)
+    if isinstance(source, io.BytesIO):
+        source = source.getbuffer()
+    elif isinstance(source, bytearray):
+        source = memoryview(source)
+    return fitz.open(stream=source, filetype="pdf")
+
+
+def _describe(source: PdfSource) -> str:
+    if isinstance(source, (str, os.PathLike)):
+        return str(source)
+    size = source.getbuffer().nbytes if isinstance(source, io.BytesIO) else len(source)
+    return f"<in-memory PDF, {size} bytes>"
+
+
+class PageExtractionError(RuntimeError):
+    """A page could not be extracted (raised instead of skipping the page when requested)."""
+
+
+def _extract_page(page, i: int, label: str, raise_errors: bool = False) -> List[TextChunk]:
+    """Extract table, text and (if needed) OCR chunks from a single page. `i` is the 1-based page number.
+
+    A page that fails is logged and yields an empty chunk, or raises PageExtractionError
+    with `raise_errors`.
     """
     chunks: List[TextChunk] = []
     try:
-        with fitz.open(file_path) as doc:
-            for i, page in enumerate(doc, start=1):
-                try:
-                    # Detect tables on the page
-                    tables = page.find_tables()
-                    table_bboxes = []
-                    for table in tables:
-                        bbox = table.bbox  # (x0, y0, x1, y1)
-                        table_bboxes.append(bbox)
-                        # extract table data
-                        try:
-                            table_data = table.extract()
-                        except Exception:
-                            # Older PyMuPDF may not have table.extract(); try table.get_text('blocks') fallback
-                            table_data = []
-
-                        # Convert table_data (list of rows) to markdown
-                        md_lines = []
-                        if table_data:
-                            # assume table_data is list of lists; sanitize None values
-                            def _cell_to_str(c):
-                                if c is None:
-                                    return ""
-                                return str(c)
-
-                            header = table_data[0]
-                            header_cells = [_cell_to_str(h).strip() for h in header]
-                            # fallback: if header is empty, skip table
-                            if any(header_cells):
-                                md_lines.append("| " + " | ".join(header_cells) + " |")
-                                md_lines.append("| " + " | ".join(["---"] * len(header_cells)) + " |")
-                                for row in table_data[1:]:
-                                    row_cells = [_cell_to_str(c).strip() for c in row]
-                                    md_lines.append("| " + " | ".join(row_cells) + " |")
-                            else:
-                                md_lines = []
-
-                        if md_lines:
-                            md_table = "\n".join(md_lines)
-                            chunks.append(TextChunk(text=md_table, page_number=i, source=TextSourceEnum.TABLE.value))
-
-                    # Now extract text blocks, excluding those inside table bounding boxes
-                    blocks = page.get_text("blocks")  # list of tuples (x0, y0, x1, y1, text, block_no) or variant lengths
-                    page_text_parts = []
-                    for b in blocks:
-                        # blocks can vary by PyMuPDF version; unpack defensively
-                        try:
-                            x0, y0, x1, y1, btext, *rest = b
-                        except Exception:
-                            # fallback: coerce to list and pick what we can
-                            b_list = list(b)
-                            if len(b_list) >= 5:
-                                x0, y0, x1, y1 = b_list[0:4]
-                                btext = b_list[4]
-                            else:
-                                # unexpected format; skip
-                                continue
-                        # Ensure text is a string
-                        if btext is None:
-                            btext = ""
-                        in_table = False
-                        for tb in table_bboxes:
-                            tx0, ty0, tx1, ty1 = tb
-                            # simple bbox containment check (block inside table bbox)
-                            if x0 >= tx0 and x1 <= tx1 and y0 >= ty0 and y1 <= ty1:
-                                in_table = True
-                                break
-                        if not in_table and isinstance(btext, str) and btext.strip():
-                            page_text_parts.append(btext)
-
-                    page_text = "\n".join(page_text_parts).strip()
-                    if page_text and len(page_text) >= 20:
-                        chunks.append(TextChunk(text=page_text, page_number=i, source=TextSourceEnum.TEXT.value))
-                    elif page_text:
-                        # small text — try OCR on the whole page image
-                        pix = page.get_pixmap()
-                        pil_img = _pixmap_to_pil(pix)
-                        ocr_text = pytesseract.image_to_string(pil_img)
-                        if ocr_text and ocr_text.strip():
-                            chunks.append(TextChunk(text=ocr_text, page_number=i, source=TextSourceEnum.OCR.value))
-                        else:
-                            chunks.append(TextChunk(text="", page_number=i, source=TextSourceEnum.OCR.value))
-
-                except Exception as page_err:
-                    logger.exception("Error extracting page %s from %s: %s", i, file_path, page_err)
-                    chunks.append(TextChunk(text="", page_number=i, source=TextSourceEnum.OCR.value))
-        return chunks
+        # Detect tables on the page
+        tables = page.find_tables()
+        table_bboxes = []
+        for table in tables:
+            bbox = table.bbox  # (x0, y0, x1, y1)
+            table_bboxes.append(bbox)
+            # extract table data
+            try:
+                table_data = table.extract()
+            except Exception:
+                # Older PyMuPDF may not have table.extract(); try table.get_text('blocks') fallback
+                table_data = []
+
+            # Convert table_data (list of rows) to markdown
+            md_lines = []
+            if table_data:
+                # assume table_data is list of lists; sanitize None values
+                def _cell_to_str(c):
+                    if c is None:
+                        return ""
+                    return str(c)
+
+                header = table_data[0]
+                header_cells = [_cell_to_str(h).strip() for h in header]
+                # fallback: if header is empty, skip table
+                if any(header_cells):
+                    md_lines.append("| " + " | ".join(header_cells) + " |")
+                    md_lines.append("| " + " | ".join(["---"] * len(header_cells)) + " |")
+                    for row in table_data[1:]:
+                        row_cells = [_cell_to_str(c).strip() for c in row]
+                        md_lines.append("| " + " | ".join(row_cells) + " |")
+                else:
+                    md_lines = []
+
+            if md_lines:
+                md_table = "\n".join(md_lines)
+                chunks.append(TextChunk(text=md_table, page_number=i, source=TextSourceEnum.TABLE.value))
+
+        # Now extract text blocks, excluding those inside table bounding boxes
+        blocks = page.get_text("blocks")  # list of tuples (x0, y0, x1, y1, text, block_no) or variant lengths
+        page_text_parts = []
+        for b in blocks:
+            # blocks can vary by PyMuPDF version; unpack defensively
+            try:
+                x0, y0, x1, y1, btext, *rest = b
+            except Exception:
+                # fallback: coerce to list and pick what we can
+                b_list = list(b)
+                if len(b_list) >= 5:
+                    x0, y0, x1, y1 = b_list[0:4]
+                    btext = b_list[4]
+                else:
+                    # unexpected format; skip
+                    continue
+            # Ensure text is a string
+            if btext is None:
+                btext = ""
+            in_table = False
+            for tb in table_bboxes:
+                tx0, ty0, tx1, ty1 = tb
+                # simple bbox containment check (block inside table bbox)
+                if x0 >= tx0 and x1 <= tx1 and y0 >= ty0 and y1 <= ty1:
+                    in_table = True
+                    break
+            if not in_table and isinstance(btext, str) and btext.strip():
+                page_text_parts.append(btext)
+
+        page_text = "\n".join(page_text_parts).strip()
+        if page_text and len(page_text) >= 20:
+            chunks.append(TextChunk(text=page_text, page_number=i, source=TextSourceEnum.TEXT.value))
+        else:
+            # little or no text (e.g. a scanned page) — try OCR on the whole page image
+            ocr_text = _ocr_page(page)
+            if ocr_text and ocr_text.strip():
+                chunks.append(TextChunk(text=ocr_text, page_number=i, source=TextSourceEnum.OCR.value))
+            else:
+                chunks.append(TextChunk(text="", page_number=i, source=TextSourceEnum.OCR.value))
+
+    except Exception as page_err:
+        logger.exception("Error extracting page %s from %s: %s", i, label, page_err)
+        if raise_errors:
+            raise PageExtractionError(f"Page {i} of {label} could not be extracted: {page_err}") from page_err
+        chunks.append(TextChunk(text="", page_number=i, source=TextSourceEnum.OCR.value))
+    return chunks
+
+
+# In-memory source of the pool this process belongs to. Only ever set inside extraction
+# pool processes (by _init_extract_worker), never in the process that owns the pool.
+_worker_source: PdfSource | None = None
+
+
+def _init_extract_worker(source: PdfSource | _SpillRef):
+    """Pool initializer: remember the in-memory PDF this worker process was started for.
+
+    A _SpillRef is mapped read-only here, so every worker shares the spill file's page
+    cache instead of holding a copy of the PDF.
+    """
+    global _worker_source
+    if isinstance(source, _SpillRef):
+        with open(source.path, "rb") as f:
+            source = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+    _worker_source = source
+
+
+def _spill_ref(source: PdfSource) -> _SpillRef | None:
+    """A _SpillRef for a memoryview over a SpilledPdf whose file workers can re-open, else None."""
+    if isinstance(source, memoryview) and isinstance(source.obj, SpilledPdf) and os.path.exists(source.obj.path):
+        return _SpillRef(source.obj.path)
+    return None
+
+
+def _pool_shares_source(source: PdfSource) -> bool:
+    """Whether extraction workers can use `source` without a copy of a spilled PDF each."""
+    if PDF_EXTRACT_START_METHOD == "fork" or not isinstance(source, memoryview) or not isinstance(source.obj, SpilledPdf):
+        return True
+    return _spill_ref(source) is not None
+
+
+def _iter_page_range(source: PdfSource, start: int, stop: int, raise_errors: bool = False) -> Iterator[TextChunk]:
+    """Yield the chunks of pages [start, stop) (0-based), one page at a time."""
+    label = _describe(source)
+    with _open_pdf(source) as doc:
+        for idx in range(start, stop):
+            yield from _extract_page(doc[idx], idx + 1, label, raise_errors)
+
+
+def _extract_page_range(source: PdfSource | None, start: int, stop: int, raise_errors: bool = False) -> List[TextChunk]:
+    """Extract pages [start, stop) (0-based). Opens the PDF itself so it can run in a worker process.
+
+    A `source` of None means the in-memory PDF the worker's pool was created with.
+    """
+    if source is None:
+        source = _worker_source
+    return list(_iter_page_range(source, start, stop, raise_errors))
+
+
+def _page_ranges(page_count: int, parts: int) -> List[Tuple[int, int]]:
+    """Split [0, page_count) into at most `parts` contiguous, near-equal ranges."""
+    parts = max(1, min(parts, page_count))
+    size, extra = divmod(page_count, parts)
+    ranges = []
+    start = 0
+    for n in range(parts):
+        stop = start + size + (1 if n < extra else 0)
+        ranges.append((start, stop))
+        start = stop
+    return ranges
+
+
+def _iter_parallel(source: PdfSource, page_count: int, workers: int,
+                   raise_errors: bool = False) -> Iterator[Tuple[int, List[TextChunk]]]:
+    """Extract page ranges in a process pool, yielding (range_stop, chunks) in page order."""
+    ranges = _page_ranges(page_count, workers * PDF_RANGES_PER_WORKER)
+    logger.info("Extracting %d pages of %s in %d ranges across %d processes", page_count, _describe(source), len(ranges), workers)
+    pool_kwargs = {"mp_context": multiprocessing.get_context(PDF_EXTRACT_START_METHOD)}
+    if isinstance(source, (str, os.PathLike)):
+        task_source = source
+    else:
+        # The buffer goes to each worker as an initializer argument of its own pool (once per
+        # process rather than once per task), so concurrent extractions in one process never
+        # see each other's PDF.
+        task_source = None
+        if isinstance(source, memoryview) and PDF_EXTRACT_START_METHOD != "fork":
+            # memoryviews cannot be pickled for spawned/forkserver children: a spilled PDF is
+            # re-mapped by each worker from its file, anything else is copied
+            source = _spill_ref(source) or bytes(source)
+        pool_kwargs.update(initializer=_init_extract_worker, initargs=(source,))
+    with ProcessPoolExecutor(max_workers=workers, **pool_kwargs) as pool:
+        # map() yields results in submission order, which is page order
+        results = pool.map(
+            _extract_page_range,
+            [task_source] * len(ranges),
+            [r[0] for r in ranges],
+            [r[1] for r in ranges],
+            [raise_errors] * len(ranges),
+        )
+        for (_, stop), part in zip(ranges, results):
+            yield stop, part
+
+
+def iter_pdf_pages(source: PdfSource, workers: int | None = None, raise_errors: bool = False) -> Iterator[TextChunk]:
+    """Generator form of extract_text_from_pdf: yields TextChunks page by page, in page order.
+
+    Consumers can start working on the first pages while later pages are still being
+    parsed (or OCR'd in the process pool). Errors opening the PDF are logged and end the
+    iteration, mirroring extract_text_from_pdf returning an empty list, and pages that
+    fail are skipped with an empty chunk; pass `raise_errors=True` to have either raised
+    after logging instead.
+    """
+    if workers is None:
+        workers = PDF_EXTRACT_WORKERS or os.cpu_count() or 1
+    label = _describe(source)
+    try:
+        with _open_pdf(source) as doc:
+            page_count = doc.page_count
+            serial = workers <= 1 or page_count < PDF_PARALLEL_MIN_PAGES
+            if not serial and not _pool_shares_source(source):
+                # Copying a spilled PDF into every worker costs more memory than the pool saves time
+                logger.info("Spill file of %s cannot be re-opened by workers; extracting serially", label)
+                serial = True
+            if serial:
+                for i, page in enumerate(doc, start=1):
+                    yield from _extract_page(page, i, label, raise_errors)
+                return
+
+        next_page = 0
+        try:
+            for stop, part in _iter_parallel(source, page_count, min(workers, page_count), raise_errors):
+                yield from part
+                next_page = stop
+        except PageExtractionError:
+            raise
+        except Exception as pool_err:
+            # e.g. daemonic Celery pool processes may not be allowed to fork children
+            logger.warning("Parallel extraction unavailable for %s (%s); continuing serially from page %d", label, pool_err, next_page + 1)
+            yield from _iter_page_range(source, next_page, page_count, raise_errors)
 
     except FileNotFoundError as fnf:
-        logger.exception("PDF file not found: %s", file_path)
-        return []
+        logger.exception("PDF file not found: %s", label)
+        if raise_errors:
+            raise
     except Exception as e:
         # fitz.errors.FitzError might be raised for corrupted PDFs
-        logger.exception("Error opening or processing PDF %s: %s", file_path, e)
-        return []
+        logger.exception("Error opening or processing PDF %s: %s", label, e)
+        if raise_errors:
+            raise
+
+
+def count_pdf_pages(source: PdfSource) -> int:
+    """Number of pages in the PDF."""
+    with _open_pdf(source) as doc:
+        return doc.page_count
+
+
+def extract_pdf_page_range(source: PdfSource, start: int, stop: int) -> List[TextChunk]:
+    """Extract pages [start, stop) (0-based), e.g. one shard of a large document.
+
+    Unlike extract_text_from_pdf, errors (including PageExtractionError for a single page)
+    are raised so a failed shard is never mistaken for pages without text.
+    """
+    page_count = count_pdf_pages(source)
+    return _extract_page_range(source, max(0, start), min(stop, page_count), raise_errors=True)
+
+
+def extract_text_from_pdf(source: PdfSource, workers: int | None = None) -> List[TextChunk]:
+    """Extract text from PDF using a hybrid strategy: direct text extraction first, then OCR fallback for image pages.
+
+    `source` is a file path or the PDF itself in memory (bytes, memoryview, BytesIO), which
+    is opened with fitz.open(stream=...) without touching local disk.
+
+    Large documents (at least PDF_PARALLEL_MIN_PAGES pages) are split into page ranges that
+    are extracted in a process pool of `workers` processes (default PDF_EXTRACT_WORKERS, or
+    one per core); each process opens the PDF independently. Small documents, a single
+    worker, or an environment where the pool cannot be started use the serial path.
+
+    Returns a list of TextChunk objects (one per page with extracted text and source), in page order.
+    """
+    return list(iter_pdf_pages(source, workers))
@@ -0,0 +1,417 @@
+import os
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from backend.database import db
+from backend.models.document import TextChunk, ProcessingStatusEnum, ContentTypeEnum, generated_content_id
+from backend.utils.artifacts import (
+    TextArtifactWriter, open_text_artifact, save_text_artifact, text_artifact_exists,
+)
+from backend.utils.chunker import chunk_text_chunks
+from backend.utils.dedup import sha256_digest, find_canonical, register_canonical, clone_document
+from backend.utils.generation import generate_content
+from backend.utils.ingest import IngestResult, ingest_chunks
+from backend.utils.pdf_parser import PARSER_VERSION, iter_pdf_pages, count_pdf_pages, extract_pdf_page_range
+from backend.utils.preselect import preselect_chunks
+from backend.utils.search import embed_texts, fetch_document_chunks
+from backend.utils.storage import open_s3_pdf
+try:
+    # Use langchain_mistralai if available
+    from langchain_mistralai.chat_models import ChatMistralAI
+except Exception:
+    ChatMistralAI = None
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Processing stages, in order. Each one records a completion marker in the document's
+# `checkpoints` map once its results are durable, and is safe to run again. Stages hand
+# their results to the next one through durable storage, so each can run as its own
+# Celery task on its own worker pool:
+# - extract: PDF parsing/OCR, persisted as an extraction artifact
+# - index: chunking, embedding and indexing into Elasticsearch (done by the extract stage
+#   itself for documents of at least STREAM_INDEX_MIN_PAGES pages, see below)
+# - generate: LLM generation, written under deterministic generated_content ids
+# - finalize: content-hash registration and the COMPLETED status
+STAGE_EXTRACT = "extract"
+STAGE_INDEX = "index"
+STAGE_GENERATE = "generate"
+STAGE_FINALIZE = "finalize"
+STAGES = (STAGE_EXTRACT, STAGE_INDEX, STAGE_GENERATE, STAGE_FINALIZE)
+
+# Documents with at least this many pages are extracted as page-range shards spread over
+# the extract workers; each shard covers SHARD_PAGES pages.
+SHARD_MIN_PAGES = int(os.getenv("SHARD_MIN_PAGES", "200"))
+SHARD_PAGES = int(os.getenv("SHARD_PAGES", "50"))
+# Documents with at least this many pages (that are not sharded) are indexed while they are
+# extracted: pages stream from the parser into both the extraction artifact and the
+# chunk/embed/index pipeline, so parsing overlaps embedding, the first pages become
+# searchable before the last ones are parsed, and memory stays bounded. Smaller documents
+# are indexed by the index stage. 0 disables streaming.
+STREAM_INDEX_MIN_PAGES = int(os.getenv("STREAM_INDEX_MIN_PAGES", "50"))
+
+
+@dataclass
+class PipelineContext:
+    document_id: str
+    user_id: str
+    doc: Dict[str, Any] = field(default_factory=dict)
+    checkpoints: Dict[str, Any] = field(default_factory=dict)
+    # Generation input (index chunks and their vectors), loaded by the generate stage
+    chunks: Optional[List[TextChunk]] = None
+    vectors: Optional[np.ndarray] = None
+    # Page ranges to extract as separate shard tasks (set by run_extract for large documents)
+    shards: Optional[List[Tuple[int, int]]] = None
+    # Result of indexing the pages while they were extracted (see STREAM_INDEX_MIN_PAGES)
+    ingest: Optional[IngestResult] = None
+
+    @property
+    def content_hash(self) -> Optional[str]:
+        return self.doc.get("content_hash")
+
+    @property
+    def s3_key(self) -> Optional[str]:
+        return self.doc.get("s3_key")
+
+
+def next_stage(checkpoints: Dict[str, Any]) -> Optional[str]:
+    """First stage without a completion marker, or None when the document is fully processed."""
+    for stage in STAGES:
+        if stage not in (checkpoints or {}):
+            return stage
+    return None
+
+
+async def load_context(ctx: PipelineContext) -> PipelineContext:
+    """Refresh the document and its checkpoints from the database."""
+    doc = await db.get_collection("documents").find_one({"_id": ctx.document_id})
+    if not doc:
+        logger.error("Document %s not found in DB", ctx.document_id)
+        raise RuntimeError("Document not found")
+    if not doc.get("s3_key"):
+        logger.error("Document %s has no s3_key", ctx.document_id)
+        raise RuntimeError("Document has no S3 key")
+    ctx.doc = doc
+    ctx.checkpoints = dict(doc.get("checkpoints") or {})
+    return ctx
+
+
+async def mark_stage(ctx: PipelineContext, stage: str, extra: Dict[str, Any] | None = None, **info):
+    """Persist the completion marker of `stage` (plus any `extra` document fields)."""
+    ctx.checkpoints[stage] = {"completed_at": datetime.utcnow(), **info}
+    await db.get_collection("documents").update_one(
+        {"_id": ctx.document_id},
+        {"$set": {"checkpoints": ctx.checkpoints, **(extra or {})}},
+    )
+    logger.info("Stage %s complete for %s", stage, ctx.document_id)
+
+
+async def _clone_duplicate(ctx: PipelineContext, content_hash: str) -> bool:
+    """Clone the results of an identical processed document; False means process normally."""
+    canonical = await find_canonical(content_hash)
+    if not canonical or canonical["_id"] == ctx.document_id:
+        return False
+    try:
+        await clone_document(canonical, ctx.document_id, ctx.user_id)
+    except Exception as e:
+        logger.exception("Cloning %s from %s failed; processing it from scratch: %s", ctx.document_id, canonical["_id"], e)
+        return False
+    now = datetime.utcnow()
+    ctx.checkpoints = {stage: {"completed_at": now, "cloned_from": canonical["_id"]} for stage in STAGES}
+    await db.get_collection("documents").update_one(
+        {"_id": ctx.document_id},
+        {"$set": {
+            "processing_status": ProcessingStatusEnum.COMPLETED.value,
+            "duplicate_of": canonical["_id"],
+            "checkpoints": ctx.checkpoints,
+        }},
+    )
+    logger.info("Document %s duplicates %s; results cloned and marked COMPLETED", ctx.document_id, canonical["_id"])
+    return True
+
+
+def shard_ranges(page_count: int, shard_pages: int = SHARD_PAGES) -> List[Tuple[int, int]]:
+    """Split [0, page_count) into consecutive (start, stop) ranges of `shard_pages` pages."""
+    shard_pages = max(1, shard_pages)
+    return [(start, min(start + shard_pages, page_count)) for start in range(0, page_count, shard_pages)]
+
+
+async def _extract_pages(ctx: PipelineContext, allow_sharding: bool = False,
+                         index_min_pages: Optional[int] = None) -> Optional[int]:
+    """Download and parse the PDF and persist the extraction artifact.
+
+    Pages are written to the artifact as they are parsed and never collected in memory.
+    Documents of at least `index_min_pages` pages are also chunked, embedded and indexed
+    on the way through (the result is left in `ctx.ingest`).
+
+    Returns the number of page chunks in the artifact, or None when the document turned
+    out to duplicate an already processed one and its results were cloned instead, or
+    when `allow_sharding` is set and the document is large enough to be extracted in
+    shards (the ranges are then left in `ctx.shards`).
+    """
+    document_id = ctx.document_id
+    logger.info("Starting S3 download and text extraction for %s (s3_key=%s)", document_id, ctx.s3_key)
+
+    # Download the PDF into memory (or an anonymous mmap'd spill file for large objects)
+    # and extract text straight from that buffer
+    async with open_s3_pdf(ctx.s3_key) as pdf_source:
+        if not ctx.content_hash:
+            # Uploaded without a fingerprint (e.g. presigned URL flow): hash the downloaded bytes
+            content_hash = sha256_digest(pdf_source)
+            ctx.doc["content_hash"] = content_hash
+            await db.get_collection("documents").update_one({"_id": document_id}, {"$set": {"content_hash": content_hash}})
+            if await _clone_duplicate(ctx, content_hash):
+                return None
+        page_count = count_pdf_pages(pdf_source)
+        if allow_sharding and SHARD_MIN_PAGES > 0 and page_count >= SHARD_MIN_PAGES:
+            ctx.shards = shard_ranges(page_count)
+            logger.info("Document %s has %d pages; extracting in %d shards of %d pages",
+                        document_id, page_count, len(ctx.shards), SHARD_PAGES)
+            return None
+
+        writer = TextArtifactWriter(ctx.content_hash)
+        try:
+            # A parse error fails the stage (and is retried) rather than persisting a partial artifact
+            pages = writer.tee(iter_pdf_pages(pdf_source, raise_errors=True))
+            if index_min_pages is not None and page_count >= index_min_pages:
+                logger.info("Indexing %s while extracting its %d pages", document_id, page_count)
+                ctx.ingest = ingest_chunks(pages, document_id, ctx.user_id,
+                                           suspend_refresh=SHARD_MIN_PAGES > 0 and page_count >= SHARD_MIN_PAGES)
+            else:
+                for _ in pages:
+                    pass
+            await writer.commit()
+        finally:
+            writer.close()
+
+    logger.info("Text extraction complete for %s: %d chunks", document_id, writer.chunks)
+    return writer.chunks
+
+
+async def _mark_indexed(ctx: PipelineContext, ingest: IngestResult, **info):
+    logger.info("Ingestion complete for %s: %d chunks embedded, %d indexed (%d failed)",
+                ctx.document_id, ingest.chunks, ingest.indexed, ingest.index_errors)
+    await mark_stage(ctx, STAGE_INDEX, chunks=ingest.chunks, indexed=ingest.indexed, **info)
+
+
+async def run_extract(ctx: PipelineContext):
+    """Extract the document's text into the extraction artifact read by the later stages.
+
+    Identical content that was already processed is cloned instead, which completes every
+    stage at once. Large documents are not extracted here: the stage is left incomplete
+    and `ctx.shards` lists the page ranges for extract_shard/merge_shards. Documents of at
+    least STREAM_INDEX_MIN_PAGES pages are indexed during extraction, which completes the
+    index stage as well.
+    """
+    if ctx.content_hash and await _clone_duplicate(ctx, ctx.content_hash):
+        return
+
+    # Extraction output stored for an earlier upload of the same content is reused as-is
+    if await text_artifact_exists(ctx.content_hash):
+        logger.info("Using stored extraction artifact for %s", ctx.document_id)
+        await mark_stage(ctx, STAGE_EXTRACT, parser_version=PARSER_VERSION, reused=True)
+        return
+    pages = await _extract_pages(ctx, allow_sharding=True,
+                                 index_min_pages=STREAM_INDEX_MIN_PAGES if STREAM_INDEX_MIN_PAGES > 0 else None)
+    if pages is None:
+        return
+    await mark_stage(ctx, STAGE_EXTRACT, pages=pages, parser_version=PARSER_VERSION)
+    if ctx.ingest is not None:
+        await _mark_indexed(ctx, ctx.ingest, streamed=True)
+
+
+async def extract_shard(document_id: str, user_id: str, start: int, stop: int) -> Tuple[int, int]:
+    """Extract pages [start, stop) of a document into a partial extraction artifact."""
+    ctx = await load_context(PipelineContext(document_id=document_id, user_id=user_id))
+    if STAGE_EXTRACT in ctx.checkpoints:
+        return start, stop
+    async with open_s3_pdf(ctx.s3_key) as pdf_source:
+        pages = extract_pdf_page_range(pdf_source, start, stop)
+    await save_text_artifact(ctx.content_hash, pages, part=(start, stop))
+    logger.info("Extracted shard %d-%d of %s: %d chunks", start + 1, stop, document_id, len(pages))
+    return start, stop
+
+
+async def merge_shards(document_id: str, user_id: str, ranges: Sequence[Sequence[int]]):
+    """Concatenate the shard artifacts in page order into the document's extraction artifact.
+
+    The shards are streamed into the merged artifact one chunk at a time.
+    """
+    ctx = await load_context(PipelineContext(document_id=document_id, user_id=user_id))
+    if STAGE_EXTRACT in ctx.checkpoints:
+        return
+    writer = TextArtifactWriter(ctx.content_hash)
+    try:
+        for start, stop in sorted((int(r[0]), int(r[1])) for r in ranges):
+            async with open_text_artifact(ctx.content_hash, part=(start, stop)) as part:
+                if part is None:
+                    raise RuntimeError(f"Extraction shard {start}-{stop} of {document_id} is missing")
+                writer.write_all(part)
+        await writer.commit()
+    finally:
+        writer.close()
+    logger.info("Merged %d extraction shards of %s: %d chunks", len(ranges), document_id, writer.chunks)
+    await mark_stage(ctx, STAGE_EXTRACT, pages=writer.chunks, parser_version=PARSER_VERSION, shards=len(ranges))
+
+
+async def run_index(ctx: PipelineContext):
+    """Chunk, embed and index the extracted pages.
+
+    Pages are streamed from the artifact through the chunk/embed/index pipeline
+    (see ingest_chunks), so embedding overlaps with chunking and Elasticsearch writes
+    and the artifact is never loaded whole.
+    """
+    document_id, user_id = ctx.document_id, ctx.user_id
+    # Very large (sharded) documents are indexed with the index refresh suspended
+    sharded = bool((ctx.checkpoints.get(STAGE_EXTRACT) or {}).get("shards"))
+    ingest = None
+    async with open_text_artifact(ctx.content_hash) as pages:
+        if pages is not None:
+            ingest = ingest_chunks(pages, document_id, user_id, suspend_refresh=sharded)
+    if ingest is None:
+        # Artifact lost or unreadable: parse the PDF again (indexing it on the way) rather than failing the document
+        logger.warning("Extraction artifact missing for %s; extracting again", document_id)
+        if await _extract_pages(ctx, index_min_pages=0) is None:
+            return
+        ingest = ctx.ingest
+    await _mark_indexed(ctx, ingest)
+
+
+async def _chunk_artifact(ctx: PipelineContext) -> Optional[List[TextChunk]]:
+    """Index chunks of the stored extraction artifact, or None when there is no artifact."""
+    async with open_text_artifact(ctx.content_hash) as pages:
+        if pages is None:
+            return None
+        return [c for c in chunk_text_chunks(pages) if c.text and c.text.strip()]
+
+
+async def _load_generation_input(ctx: PipelineContext):
+    """Load the index chunks and their vectors for generation.
+
+    The vectors written by the index stage are read back from Elasticsearch. If the index
+    is incomplete (indexing is best-effort), the chunks are rebuilt from the extraction
+    artifact and embedded again instead.
+    """
+    expected = (ctx.checkpoints.get(STAGE_INDEX) or {}).get("chunks")
+    try:
+        chunks, vectors = await asyncio.to_thread(fetch_document_chunks, ctx.document_id)
+        if chunks and len(chunks) == expected:
+            ctx.chunks, ctx.vectors = chunks, np.asarray(vectors, dtype=np.float32)
+            return
+        logger.info("Index holds %d of %s chunks for %s; re-embedding for generation", len(chunks), expected, ctx.document_id)
+    except Exception as e:
+        logger.warning("Could not read indexed chunks for %s (%s); re-embedding for generation", ctx.document_id, e)
+
+    chunks = await _chunk_artifact(ctx)
+    if chunks is None:
+        logger.info("No extraction artifact for %s; re-extracting for generation", ctx.document_id)
+        await _extract_pages(ctx)
+        chunks = await _chunk_artifact(ctx) or []
+    vectors = np.asarray(embed_texts([c.text for c in chunks]), dtype=np.float32) if chunks else None
+    ctx.chunks, ctx.vectors = chunks, vectors
+
+
+async def run_generate(ctx: PipelineContext):
+    """Generate the summary, mind map and flashcards and store them."""
+    document_id, user_id = ctx.document_id, ctx.user_id
+    if ctx.chunks is None:
+        await _load_generation_input(ctx)
+
+    # The chunk vectors drive passage pre-selection for generation
+    generation_chunks = ctx.chunks
+    if ctx.chunks:
+        generation_chunks, coverage = preselect_chunks(ctx.chunks, ctx.vectors)
+        logger.info("Pre-selected %d/%d chunks (%d/%d tokens, %d/%d pages) for generation of %s",
+                    coverage["selected_chunks"], coverage["total_chunks"],
+                    coverage["selected_tokens"], coverage["total_tokens"],
+                    coverage["covered_pages"], coverage["total_pages"], document_id)
+
+    # If ChatMistralAI is available, use it; otherwise, fall back to simple placeholder
+    if ChatMistralAI is None:
+        logger.warning("ChatMistralAI not available; using placeholder generated content for %s", document_id)
+        # create simple placeholders
+        summary_json = {"title": ctx.doc.get("original_filename"), "content": "[LLM not available]"}
+        mind_json = {"title": ctx.doc.get("original_filename"), "children": []}
+        flash_json = {"flashcards": []}
+    else:
+        logger.info("Initializing LLM for document %s", document_id)
+        llm = ChatMistralAI(model="mistral-large-latest", temperature=0)
+
+        logger.info("Generating SUMMARY, MINDMAP and FLASHCARDS for %s", document_id)
+        summary_json, mind_json, flash_json = generate_content(generation_chunks, llm)
+        logger.info("Content generation complete for %s", document_id)
+
+    # Store generated contents under deterministic ids: a retry overwrites instead of duplicating
+    generated_items = [
+        (ContentTypeEnum.SUMMARY.value, summary_json),
+        (ContentTypeEnum.MINDMAP.value, mind_json),
+        (ContentTypeEnum.FLASHCARDS.value, flash_json),
+    ]
+
+    logger.info("Storing %d generated items for %s", len(generated_items), document_id)
+    await db.get_collection("generated_content").insert_many([
+        {
+            "_id": generated_content_id(document_id, ctype),
+            "document_id": document_id,
+            "user_id": user_id,
+            "content_type": ctype,
+            "content_data": data,
+            "created_at": datetime.utcnow(),
+        }
+        for ctype, data in generated_items
+    ])
+    await mark_stage(ctx, STAGE_GENERATE, items=len(generated_items))
+
+
+async def run_finalize(ctx: PipelineContext):
+    """Register the content hash for deduplication and mark the document COMPLETED."""
+    try:
+        await register_canonical(ctx.content_hash, ctx.document_id, ctx.user_id, ctx.s3_key)
+    except Exception as e:
+        logger.warning("Failed to register content hash for %s: %s", ctx.document_id, e)
+
+    logger.info("Processing completed successfully for %s. Marking COMPLETED", ctx.document_id)
+    await mark_stage(ctx, STAGE_FINALIZE, extra={"processing_status": ProcessingStatusEnum.COMPLETED.value})
+
+
+STAGE_RUNNERS = {
+    STAGE_EXTRACT: run_extract,
+    STAGE_INDEX: run_index,
+    STAGE_GENERATE: run_generate,
+    STAGE_FINALIZE: run_finalize,
+}
+
+
+async def run_stage(stage: str, document_id: str, user_id: str) -> PipelineContext:
+    """Run a single stage for a document unless its completion marker already exists."""
+    ctx = await load_context(PipelineContext(document_id=document_id, user_id=user_id))
+    if stage in ctx.checkpoints:
+        logger.info("Stage %s already complete for %s; skipping", stage, document_id)
+        return ctx
+    pending = next_stage(ctx.checkpoints)
+    if pending != stage:
+        raise RuntimeError(f"Stage {stage} cannot run for {document_id} before stage {pending}")
+    await STAGE_RUNNERS[stage](ctx)
+    return ctx
+
+
+async def pending_stages(document_id: str, user_id: str) -> List[str]:
+    """Stages still to run for a document, in order."""
+    ctx = await load_context(PipelineContext(document_id=document_id, user_id=user_id))
+    return [stage for stage in STAGES if stage not in ctx.checkpoints]
+
+
+async def mark_failed(document_id: str):
+    """Mark a document FAILED once a stage has exhausted its retries."""
+    logger.error("Processing failed for %s. Marking FAILED", document_id)
+    res = await db.get_collection("documents").update_one(
+        {"_id": document_id},
+        {"$set": {"processing_status": ProcessingStatusEnum.FAILED.value}},
+    )
+    logger.info("Update result for FAILED: %s", getattr(res, 'matched_count', res))
@@ -0,0 +1,185 @@
+import os
+import math
+import logging
+from typing import Any, Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from backend.models.document import TextChunk
+from backend.utils.tokens import count_tokens
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Approximate token budget for the passages handed to LLM generation.
+PRESELECT_TOKEN_BUDGET = int(os.getenv("PRESELECT_TOKEN_BUDGET", "24000"))
+# Cosine similarity above which two passages are treated as duplicates (repeated
+# headers/footers, license pages, copied slides).
+PRESELECT_REDUNDANCY_THRESHOLD = float(os.getenv("PRESELECT_REDUNDANCY_THRESHOLD", "0.95"))
+PRESELECT_KMEANS_ITERATIONS = int(os.getenv("PRESELECT_KMEANS_ITERATIONS", "20"))
+# Documents with at least this many chunks are deduplicated within k-means buckets (about
+# sqrt(n) of them) instead of comparing every chunk with every kept chunk.
+PRESELECT_DEDUP_BUCKET_MIN_CHUNKS = int(os.getenv("PRESELECT_DEDUP_BUCKET_MIN_CHUNKS", "2000"))
+PRESELECT_DEDUP_KMEANS_ITERATIONS = int(os.getenv("PRESELECT_DEDUP_KMEANS_ITERATIONS", "5"))
+
+
+def _normalize(vectors: Sequence[Sequence[float]]) -> np.ndarray:
+    mat = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(mat, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return mat / norms
+
+
+def _drop_exact(mat: np.ndarray, threshold: float) -> List[int]:
+    """Compare every row with every earlier kept row; kept rows go to a preallocated matrix."""
+    kept: List[int] = []
+    kept_mat = np.empty_like(mat)
+    for i in range(mat.shape[0]):
+        n = len(kept)
+        if n and float(np.max(kept_mat[:n] @ mat[i])) >= threshold:
+            continue
+        kept_mat[n] = mat[i]
+        kept.append(i)
+    return kept
+
+
+def _drop_duplicates(mat: np.ndarray, threshold: float) -> List[int]:
+    """Return indices of rows that are not near-duplicates of an earlier kept row.
+
+    Below PRESELECT_DEDUP_BUCKET_MIN_CHUNKS rows every row is compared with every kept
+    row. Larger inputs are first bucketed with a coarse spherical k-means (about sqrt(n)
+    buckets) and compared only within their bucket, which keeps the cost near n^1.5
+    instead of n^2. Near-duplicates almost always share a bucket; the rare pair split
+    across two buckets is kept twice.
+    """
+    n = mat.shape[0]
+    if n < max(PRESELECT_DEDUP_BUCKET_MIN_CHUNKS, 2):
+        return _drop_exact(mat, threshold)
+    labels, centroids = _kmeans(mat, int(math.sqrt(n)), max(1, PRESELECT_DEDUP_KMEANS_ITERATIONS), plusplus=False)
+    kept: List[int] = []
+    for c in range(centroids.shape[0]):
+        members = np.flatnonzero(labels == c)
+        kept.extend(int(members[j]) for j in _drop_exact(mat[members], threshold))
+    return sorted(kept)
+
+
+def _kmeans(mat: np.ndarray, k: int, iterations: int, plusplus: bool = True) -> Tuple[np.ndarray, np.ndarray]:
+    """Spherical k-means with deterministic k-means++ seeding.
+
+    With `plusplus=False` the seeds are k distinct random rows instead, which avoids the
+    k passes over the data of k-means++ when k is large. Returns (labels, centroids)
+    where centroids are unit-normalized.
+    """
+    rng = np.random.default_rng(0)
+    n = mat.shape[0]
+    if plusplus:
+        centroids = [mat[rng.integers(n)]]
+        for _ in range(1, k):
+            # distance to closest centroid for cosine-normalized vectors
+            dist = 1.0 - np.max(mat @ np.stack(centroids).T, axis=1)
+            dist = np.clip(dist, 0.0, None)
+            total = float(dist.sum())
+            if total <= 0:
+                break
+            centroids.append(mat[rng.choice(n, p=dist / total)])
+        centroids = np.stack(centroids)
+    else:
+        centroids = mat[rng.choice(n, size=min(k, n), replace=False)].copy()
+
+    labels = None
+    for _ in range(iterations):
+        new_labels = np.argmax(mat @ centroids.T, axis=1)
+        if labels is not None and np.array_equal(new_labels, labels):
+            break
+        labels = new_labels
+        for c in range(centroids.shape[0]):
+            members = mat[labels == c]
+            if len(members):
+                centroid = members.sum(axis=0)
+                norm = np.linalg.norm(centroid)
+                centroids[c] = centroid / norm if norm else centroid
+    return labels, centroids
+
+
+def preselect_chunks(
+    chunks: List[TextChunk],
+    vectors: Sequence[Sequence[float]],
+    token_budget: int = PRESELECT_TOKEN_BUDGET,
+    redundancy_threshold: float = PRESELECT_REDUNDANCY_THRESHOLD,
+) -> Tuple[List[TextChunk], Dict[str, Any]]:
+    """Pick representative, non-redundant chunks up to `token_budget` using their embeddings.
+
+    Near-duplicate chunks are dropped first. If the rest still exceeds the budget, the
+    embeddings are clustered and chunks are taken round-robin from the clusters (largest
+    first, closest to the centroid first) until the budget is used up, so that every
+    topic of the document is represented. The selected chunks are returned in their
+    original order together with coverage statistics.
+    """
+    if len(chunks) != len(vectors):
+        raise ValueError("chunks and vectors must have the same length")
+
+    token_counts = [count_tokens(c.text) for c in chunks]
+    total_tokens = sum(token_counts)
+    stats: Dict[str, Any] = {
+        "total_chunks": len(chunks),
+        "total_tokens": total_tokens,
+        "total_pages": len({c.page_number for c in chunks}),
+        "duplicates_removed": 0,
+        "clusters": 0,
+        "clusters_covered": 0,
+    }
+    if not chunks:
+        stats.update(selected_chunks=0, selected_tokens=0, covered_pages=0, token_reduction=0.0)
+        return [], stats
+
+    mat = _normalize(vectors)
+    candidates = _drop_duplicates(mat, redundancy_threshold)
+    stats["duplicates_removed"] = len(chunks) - len(candidates)
+
+    if sum(token_counts[i] for i in candidates) <= token_budget:
+        selected = candidates
+    else:
+        sub = mat[candidates]
+        mean_tokens = max(1.0, sum(token_counts[i] for i in candidates) / len(candidates))
+        k = int(min(len(candidates), max(1, round(token_budget / mean_tokens))))
+        labels, centroids = _kmeans(sub, k, PRESELECT_KMEANS_ITERATIONS)
+        stats["clusters"] = int(centroids.shape[0])
+
+        # Members of each cluster, best representative (closest to the centroid) first
+        sims = np.sum(sub * centroids[labels], axis=1)
+        clusters = []
+        for c in range(centroids.shape[0]):
+            members = np.flatnonzero(labels == c)
+            if len(members):
+                clusters.append([candidates[j] for j in members[np.argsort(-sims[members])]])
+        clusters.sort(key=len, reverse=True)
+
+        selected = []
+        covered = set()
+        used = 0
+        depth = 0
+        while used < token_budget and any(depth < len(m) for m in clusters):
+            for ci, members in enumerate(clusters):
+                if depth >= len(members):
+                    continue
+                idx = members[depth]
+                if used + token_counts[idx] > token_budget:
+                    continue
+                selected.append(idx)
+                covered.add(ci)
+                used += token_counts[idx]
+            depth += 1
+        stats["clusters_covered"] = len(covered)
+        selected.sort()
+
+    chosen = [chunks[i] for i in selected]
+    selected_tokens = sum(token_counts[i] for i in selected)
+    stats.update(
+        selected_chunks=len(chosen),
+        selected_tokens=selected_tokens,
+        covered_pages=len({c.page_number for c in chosen}),
+        token_reduction=round(1.0 - selected_tokens / total_tokens, 4) if total_tokens else 0.0,
+    )
+    logger.info("Pre-selection stats: %s", stats)
+    return chosen, stats
@@ -1,10 +1,22 @@
-from elasticsearch import Elasticsearch, exceptions
-from typing import Dict, Any
+from elasticsearch import Elasticsearch, exceptions, helpers
+from typing import Dict, Any, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+from contextlib import contextmanager
+from functools import lru_cache
+import os
+import hashlib
+import time
 import logging
+import threading
 from dotenv import load_dotenv 
 load_dotenv()  # Load environment variables from .env file
-from langchain_community.vectorstores import ElasticsearchStore
 from langchain_community.embeddings import HuggingFaceEmbeddings
+try:
+    import redis
+except Exception:
+    redis = None
+
+from backend.models.document import TextChunk
+from backend.utils.embedding_cache import EMBEDDING_CACHE, CachedEmbeddings
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
@@ -12,6 +24,128 @@ logger.setLevel(logging.INFO)
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_EMBEDDING_MODEL = "sentence-transformers/all-mpnet-base-v2"
+
+# Texts embedded per model call when indexing without precomputed vectors.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Documents per bulk request and concurrent bulk requests per indexing call.
+ES_BULK_CHUNK_SIZE = int(os.getenv("ES_BULK_CHUNK_SIZE", "500"))
+ES_BULK_THREADS = int(os.getenv("ES_BULK_THREADS", "4"))
+# Extra attempts for items rejected with a retryable status (e.g. 429 when the write queue is full).
+ES_BULK_RETRIES = int(os.getenv("ES_BULK_RETRIES", "2"))
+# Indexing calls with at least this many documents suspend the index refresh until they finish.
+ES_SUSPEND_REFRESH_MIN_DOCS = int(os.getenv("ES_SUSPEND_REFRESH_MIN_DOCS", "2000"))
+# Redis counting the ingests that currently suspend an index's refresh, shared by every
+# worker so the refresh is only restored when the last of them ends.
+ES_REFRESH_SUSPEND_REDIS_URL = os.getenv("ES_REFRESH_SUSPEND_REDIS_URL") or os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
+# A suspension count not renewed for this long is treated as left behind by crashed ingests.
+ES_REFRESH_SUSPEND_LEASE_SECONDS = int(os.getenv("ES_REFRESH_SUSPEND_LEASE_SECONDS", str(6 * 3600)))
+
+_RETRYABLE_STATUSES = {429, 502, 503, 504}
+
+
+def chunk_id(document_id: str, page_number: int, ordinal: int, text: str) -> str:
+    """Deterministic Elasticsearch _id of an indexed chunk.
+
+    Derived from the document, the chunk's page and position, and a hash of its text, so
+    re-indexing the same document overwrites its chunks instead of appending copies.
+    """
+    digest = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+    return f"{document_id}:{int(page_number or 0):05d}:{ordinal:06d}:{digest}"
+
+
+def keyword_term(field: str, value) -> Dict[str, Any]:
+    """Match `field` whether it is mapped as keyword or dynamically as text with a .keyword subfield."""
+    return {"bool": {"should": [
+        {"term": {field: value}},
+        {"term": {f"{field}.keyword": value}},
+    ], "minimum_should_match": 1}}
+
+
+class _RefreshSuspensions:
+    """Number of ingests suspending each index's refresh, and the interval to restore.
+
+    Kept in Redis so that overlapping ingests in different workers share one count (with
+    a Redis lock around each suspend/restore), or in this process when the redis package
+    is not installed.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[str, int] = {}
+        self._previous: Dict[str, Optional[str]] = {}
+        self._redis = redis.Redis.from_url(ES_REFRESH_SUSPEND_REDIS_URL) if redis is not None else None
+
+    @contextmanager
+    def locked(self, index_name: str) -> Iterator[None]:
+        if self._redis is None:
+            with self._lock:
+                yield
+        else:
+            with self._redis.lock(f"es:refresh:{index_name}:lock", timeout=60, blocking_timeout=30):
+                yield
+
+    def add(self, index_name: str, delta: int) -> int:
+        """Change the count of suspending ingests by `delta`; returns the new count."""
+        if self._redis is None:
+            count = self._counts[index_name] = max(0, self._counts.get(index_name, 0) + delta)
+            return count
+        key = f"es:refresh:{index_name}:count"
+        count = self._redis.incrby(key, delta)
+        if count <= 0:
+            self._redis.delete(key)
+        else:
+            self._redis.expire(key, ES_REFRESH_SUSPEND_LEASE_SECONDS)
+        return max(0, count)
+
+    def get_previous(self, index_name: str) -> Optional[str]:
+        if self._redis is None:
+            return self._previous.get(index_name)
+        value = self._redis.get(f"es:refresh:{index_name}:previous")
+        return (value.decode() or None) if value is not None else None
+
+    def set_previous(self, index_name: str, previous: Optional[str]):
+        if self._redis is None:
+            self._previous[index_name] = previous
+        else:
+            self._redis.set(f"es:refresh:{index_name}:previous", previous or "")
+
+    def clear_previous(self, index_name: str):
+        if self._redis is None:
+            self._previous.pop(index_name, None)
+        else:
+            self._redis.delete(f"es:refresh:{index_name}:previous")
+
+
+_refresh_suspensions = _RefreshSuspensions()
+
+
+class BulkIndexResult(NamedTuple):
+    indexed: int
+    # One entry per document that could not be written: position, _id, HTTP status, error
+    errors: List[Dict[str, Any]]
+
+
+@lru_cache(maxsize=2)
+def get_embeddings(model_name: str = DEFAULT_EMBEDDING_MODEL):
+    """Return a process-wide HuggingFaceEmbeddings instance so the model is loaded once per worker.
+
+    Unless EMBEDDING_CACHE is "off", the model is wrapped in CachedEmbeddings so chunk texts
+    embedded before (by any document and any worker) are not encoded again.
+    """
+    if HuggingFaceEmbeddings is None:
+        raise RuntimeError("Embeddings not installed. Please install sentence-transformers and langchain.")
+    logger.info("Initializing embeddings model: %s", model_name)
+    embeddings = HuggingFaceEmbeddings(model_name=model_name)
+    if EMBEDDING_CACHE == "off":
+        return embeddings
+    return CachedEmbeddings(embeddings, model_name)
+
+
+def embed_texts(texts: list[str], model_name: str = DEFAULT_EMBEDDING_MODEL) -> list[list[float]]:
+    """Embed `texts` with the shared embeddings model."""
+    return get_embeddings(model_name).embed_documents(texts)
+
 
 class ElasticsearchClient:
     def __init__(self, host: str = "http://localhost:9200"):
@@ -39,6 +173,7 @@ class ElasticsearchClient:
                         }
                     },
                     "page_number": {"type": "integer"},
+                    "page_end": {"type": "integer"},
                     "source": {"type": "keyword"},
                     "document_id": {"type": "keyword"},
                     "user_id": {"type": "keyword"},
@@ -60,6 +195,9 @@ class ElasticsearchClient:
                     "metadata": {
                         "properties": {
                             "page_number": {"type": "integer"},
+                            "page_end": {"type": "integer"},
+                            "chunk_index": {"type": "integer"},
+                            "ingest_run": {"type": "keyword"},
                             "source": {"type": "keyword"},
                             "document_id": {"type": "keyword"},
                             "user_id": {"type": "keyword"}
@@ -91,6 +229,130 @@ class ElasticsearchClient:
             }
         }
 
+    @contextmanager
+    def suspended_refresh(self, index_name: str) -> Iterator[None]:
+        """Disable periodic refresh of `index_name` for the duration of a large ingest.
+
+        Overlapping ingests share the suspension: the first one turns the refresh off and
+        remembers the refresh_interval it found, and only the last one to finish restores
+        that interval and refreshes the index once, so the new documents become searchable
+        together.
+        """
+        suspended = False
+        try:
+            with _refresh_suspensions.locked(index_name):
+                count = _refresh_suspensions.add(index_name, 1)
+                try:
+                    if count == 1:
+                        settings = self.client.indices.get_settings(index=index_name, name="index.refresh_interval")
+                        previous = settings.get(index_name, {}).get("settings", {}).get("index", {}).get("refresh_interval")
+                        if previous == "-1":
+                            # Left off by an ingest that never finished; keep the interval it saved
+                            previous = _refresh_suspensions.get_previous(index_name)
+                        _refresh_suspensions.set_previous(index_name, previous)
+                        self.client.indices.put_settings(index=index_name, body={"index": {"refresh_interval": "-1"}})
+                        logger.info("Suspended refresh of %s (was %s)", index_name, previous or "default")
+                except Exception:
+                    _refresh_suspensions.add(index_name, -1)
+                    raise
+            suspended = True
+        except Exception as e:
+            logger.warning("Could not suspend refresh of %s: %s", index_name, e)
+        try:
+            yield
+        finally:
+            if suspended:
+                try:
+                    with _refresh_suspensions.locked(index_name):
+                        remaining = _refresh_suspensions.add(index_name, -1)
+                        if remaining:
+                            logger.info("Refresh of %s stays suspended for %d other ingests", index_name, remaining)
+                        else:
+                            previous = _refresh_suspensions.get_previous(index_name)
+                            self.client.indices.put_settings(index=index_name, body={"index": {"refresh_interval": previous}})
+                            _refresh_suspensions.clear_previous(index_name)
+                            self.client.indices.refresh(index=index_name)
+                            logger.info("Restored refresh of %s (%s)", index_name, previous or "default")
+                except Exception as e:
+                    logger.warning("Could not restore refresh of %s: %s", index_name, e)
+
+    def bulk_index(
+        self,
+        index_name: str,
+        texts: Sequence[str],
+        vectors: Sequence[Sequence[float]],
+        metadatas: Sequence[dict],
+        ids: Optional[Sequence[str]] = None,
+        chunk_size: int = ES_BULK_CHUNK_SIZE,
+        thread_count: int = ES_BULK_THREADS,
+    ) -> BulkIndexResult:
+        """Write already embedded chunks with parallel bulk requests.
+
+        Documents keep the LangChain ElasticsearchStore shape (text / vector / metadata) so
+        the chat retrieval queries are unaffected. Items rejected with a retryable status are
+        resubmitted on their own (their vectors are reused); other failures are returned
+        per item instead of failing the whole call.
+        """
+        def action(i: int) -> Dict[str, Any]:
+            doc = {
+                "_op_type": "index",
+                "_index": index_name,
+                "_source": {"text": texts[i], "vector": list(map(float, vectors[i])), "metadata": metadatas[i]},
+            }
+            if ids is not None:
+                doc["_id"] = ids[i]
+            return doc
+
+        pending = list(range(len(texts)))
+        indexed = 0
+        errors: List[Dict[str, Any]] = []
+        for attempt in range(ES_BULK_RETRIES + 1):
+            retry = []
+            results = helpers.parallel_bulk(
+                self.client,
+                (action(i) for i in pending),
+                thread_count=max(1, thread_count),
+                chunk_size=max(1, chunk_size),
+                raise_on_error=False,
+                raise_on_exception=False,
+            )
+            # parallel_bulk yields one result per action, in submission order
+            for i, (ok, info) in zip(pending, results):
+                if ok:
+                    indexed += 1
+                    continue
+                item = info.get("index", info) if isinstance(info, dict) else {"error": str(info)}
+                status = item.get("status")
+                if status in _RETRYABLE_STATUSES and attempt < ES_BULK_RETRIES:
+                    retry.append(i)
+                else:
+                    errors.append({"position": i, "_id": item.get("_id"), "status": status, "error": item.get("error")})
+            if not retry:
+                break
+            logger.info("Retrying %d rejected documents for %s (attempt %d)", len(retry), index_name, attempt + 2)
+            time.sleep(0.5 * (2 ** attempt))
+            pending = retry
+
+        if errors:
+            logger.warning("Bulk indexing into %s: %d indexed, %d failed (first error: %s)", index_name, indexed, len(errors), errors[0])
+        return BulkIndexResult(indexed=indexed, errors=errors)
+
+    def delete_stale_chunks(self, index_name: str, document_id: str, ingest_run: str) -> int:
+        """Delete a document's chunks that were not written by `ingest_run`, in one delete-by-query pass."""
+        resp = self.client.delete_by_query(
+            index=index_name,
+            body={"query": {"bool": {
+                "filter": [keyword_term("metadata.document_id", document_id)],
+                "must_not": [keyword_term("metadata.ingest_run", ingest_run)],
+            }}},
+            conflicts="proceed",
+            refresh=True,
+        )
+        deleted = int(resp.get("deleted", 0))
+        if deleted:
+            logger.info("Deleted %d stale chunks of %s from %s", deleted, document_id, index_name)
+        return deleted
+
     def create_index_if_not_exists(self, index_name: str, mapping: Dict[str, Any] | None = None):
         try:
             exists = self.client.indices.exists(index=index_name)
@@ -110,67 +372,56 @@ class ElasticsearchClient:
     async def create_langchain_indexes(self,
         texts: list[str],
         metadatas: list[dict],
-        model_name: str = "sentence-transformers/all-mpnet-base-v2",
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
         es_host: str = "http://localhost:9200",
         es_index_name: str = "pdf_chunks",
-    ):
-        """Create an Elasticsearch index using LangChain's ElasticsearchStore.
+        vectors: list[list[float]] | None = None,
+        ids: list[str] | None = None,
+    ) -> BulkIndexResult:
+        """Embed texts and index them into Elasticsearch with native bulk requests.
 
-        This function embeds texts using HuggingFaceEmbeddings and indexes them
-        into Elasticsearch. It no longer uses a local FAISS index; vectors are
-        stored directly in Elasticsearch under the `embedding` dense_vector field.
+        Texts are embedded in batches of EMBED_BATCH_SIZE with the shared HuggingFace model
+        and written with parallel bulk requests (ES_BULK_CHUNK_SIZE documents each,
+        ES_BULK_THREADS at a time). When `vectors` are supplied (one per text) they are
+        indexed as-is and the texts are not embedded again. Large ingests suspend the index
+        refresh until they finish. Documents that could not be written are reported in the
+        result rather than raising, so callers never need to re-embed to retry them.
         """
-        if HuggingFaceEmbeddings is None:
-            raise RuntimeError("Embeddings not installed. Please install sentence-transformers and langchain.")
-
-        # Initialize embeddings model
-        logger.info("Initializing embeddings model: %s", model_name)
-        embeddings = HuggingFaceEmbeddings(model_name=model_name)
-
-        # Index into Elasticsearch using LangChain's store. This will embed texts
-        # and push vectors into the ES `embedding` field according to the mapping.
-        if ElasticsearchStore is not None:
-            logger.info("Indexing %d documents into ES index=%s via LangChain ElasticsearchStore", len(texts), es_index_name)
-            try:
-                # Ensure index exists with correct mapping before LangChain writes
-                try:
-                    self.create_index_if_not_exists(es_index_name)
-                except Exception as ci_err:
-                    logger.warning("Could not ensure index exists (%s): %s", es_index_name, ci_err)
+        try:
+            # Ensure index exists with correct mapping before writing
+            self.create_index_if_not_exists(es_index_name)
+        except Exception as ci_err:
+            logger.warning("Could not ensure index exists (%s): %s", es_index_name, ci_err)
 
-                # Different langchain versions expect different kwarg names: index_name or index
-                try:
-                    ElasticsearchStore.from_texts(
-                        texts=texts,
-                        embedding=embeddings,
-                        metadatas=metadatas,
-                        es_url=es_host,
-                        index_name=es_index_name,
-                    )
-                except Exception as e_idxname:
-                    logger.info("ElasticsearchStore.from_texts failed with index_name, trying 'index' kwarg: %s", e_idxname)
-                    ElasticsearchStore.from_texts(
-                        texts=texts,
-                        embedding=embeddings,
-                        metadatas=metadatas,
-                        es_url=es_host,
-                        index=es_index_name,
-                    )
-                logger.info("LangChain indexing to %s completed", es_index_name)
-            except Exception as e:
-                logger.exception("LangChain ElasticsearchStore.from_texts failed: %s", e)
-                raise
+        if vectors is None:
+            embeddings = get_embeddings(model_name)
+            vectors = []
+            for start in range(0, len(texts), EMBED_BATCH_SIZE):
+                vectors.extend(embeddings.embed_documents(list(texts[start:start + EMBED_BATCH_SIZE])))
+            logger.info("Embedded %d texts in batches of %d", len(texts), EMBED_BATCH_SIZE)
+        else:
+            logger.info("Using %d precomputed vectors for ES index=%s", len(vectors), es_index_name)
+
+        logger.info("Bulk indexing %d documents into ES index=%s", len(texts), es_index_name)
+        if len(texts) >= ES_SUSPEND_REFRESH_MIN_DOCS:
+            with self.suspended_refresh(es_index_name):
+                result = self.bulk_index(es_index_name, texts, vectors, metadatas, ids=ids)
         else:
-            logger.warning("ElasticsearchStore not available; skipping ES indexing")
+            result = self.bulk_index(es_index_name, texts, vectors, metadatas, ids=ids)
+            self.client.indices.refresh(index=es_index_name)
+        logger.info("Bulk indexing to %s completed: %d indexed, %d failed", es_index_name, result.indexed, len(result.errors))
+        return result
 
 
 async def create_langchain_indexes(
     texts: list[str],
     metadatas: list[dict],
-    model_name: str = "sentence-transformers/all-mpnet-base-v2",
+    model_name: str = DEFAULT_EMBEDDING_MODEL,
     es_host: str = "http://localhost:9200",
     es_index_name: str = "pdf_chunks",
-):
+    vectors: list[list[float]] | None = None,
+    ids: list[str] | None = None,
+) -> BulkIndexResult:
     """Module-level wrapper for creating LangChain indexes using Elasticsearch.
 
     This delegates to the ElasticsearchClient implementation to preserve
@@ -184,6 +435,52 @@ async def create_langchain_indexes(
         model_name=model_name,
         es_host=es_host,
         es_index_name=es_index_name,
+        vectors=vectors,
+        ids=ids,
     )
     logger.info("create_langchain_indexes wrapper finished: index=%s", es_index_name)
     return res
+
+
+def get_index_client(es_host: str = "http://localhost:9200", es_index_name: str = "pdf_chunks") -> ElasticsearchClient:
+    """Return an ElasticsearchClient for incremental writes, ensuring the index exists first."""
+    client = ElasticsearchClient(host=es_host)
+    try:
+        client.create_index_if_not_exists(es_index_name)
+    except Exception as ci_err:
+        logger.warning("Could not ensure index exists (%s): %s", es_index_name, ci_err)
+    return client
+
+
+def fetch_document_chunks(
+    document_id: str,
+    es_host: str = "http://localhost:9200",
+    es_index_name: str = "pdf_chunks",
+) -> Tuple[List[TextChunk], List[List[float]]]:
+    """Read back the indexed chunks of a document together with their stored vectors.
+
+    Chunks are returned in document order (by `chunk_index`, falling back to page number).
+    """
+    client = ElasticsearchClient(host=es_host).client
+    query = keyword_term("metadata.document_id", document_id)
+    hits = []
+    for hit in helpers.scan(client, index=es_index_name, query={"query": query}, _source=["text", "vector", "metadata"]):
+        src = hit.get("_source", {})
+        md = src.get("metadata") or {}
+        if src.get("vector") is None:
+            continue
+        hits.append((md.get("chunk_index", md.get("page_number") or 0), md.get("page_number") or 0, src, md))
+    hits.sort(key=lambda h: (h[0], h[1]))
+
+    chunks = []
+    vectors = []
+    for _, _, src, md in hits:
+        chunks.append(TextChunk(
+            text=src.get("text", ""),
+            page_number=md.get("page_number") or 0,
+            page_end=md.get("page_end"),
+            source=md.get("source") or "TEXT",
+        ))
+        vectors.append(src["vector"])
+    logger.info("Fetched %d indexed chunks for document %s from %s", len(chunks), document_id, es_index_name)
+    return chunks, vectors
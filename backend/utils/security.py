@@ -1,5 +1,12 @@
 import bcrypt
 import os
+import copy
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
 from datetime import datetime, timedelta
 from jose import jwt
 from jose import JWTError
@@ -10,17 +17,33 @@ from backend.models.user import TokenData
 from backend.database import users_collection
 from fastapi import HTTPException, status
 
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
 # JWT settings - can be provided via environment variables (you said you'll set .env)
 SECRET_KEY = os.getenv("SECRET_KEY", "changemeplease")
 ALGORITHM = os.getenv("ALGORITHM", "HS256")
 ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+# Authenticated user records are cached per process for this long (0 disables the cache),
+# so most requests skip the DynamoDB lookup. User records are not modified after
+# registration, so a cached record is only ever dropped when it expires.
+USER_CACHE_TTL_SECONDS = float(os.getenv("USER_CACHE_TTL_SECONDS", "60"))
+USER_CACHE_MAX_ENTRIES = int(os.getenv("USER_CACHE_MAX_ENTRIES", "10000"))
+# bcrypt work factor for new hashes (existing hashes keep the cost they were created with).
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+# Threads hashing and verifying passwords off the event loop. bcrypt releases the GIL,
+# so throughput scales with cores.
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(os.cpu_count() or 2)))
+# Password operations allowed in flight (queued or running); beyond this requests get a 503
+# instead of queueing without bound.
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", "256"))
 
 
 def hash_password(password: str) -> str:
     """Hash a plain-text password using bcrypt and return the hash as a UTF-8 string."""
     if isinstance(password, str):
         password = password.encode("utf-8")
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=BCRYPT_ROUNDS)
     hashed = bcrypt.hashpw(password, salt)
     return hashed.decode("utf-8")
 
@@ -32,12 +55,63 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
             plain_password = plain_password.encode("utf-8")
         if isinstance(hashed_password, str):
             hashed_password = hashed_password.encode("utf-8")
-        # return 
-        return True
+        return bcrypt.checkpw(plain_password, hashed_password)
     except Exception:
         return False
 
 
+_password_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+_password_lock = threading.Lock()
+_password_stats = {"pending": 0, "completed": 0, "rejected": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+
+
+async def _run_password_op(fn, *args):
+    """Run a bcrypt operation on the bounded password pool, recording queueing metrics."""
+    with _password_lock:
+        if _password_stats["pending"] >= BCRYPT_MAX_PENDING:
+            _password_stats["rejected"] += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent sign-ins, please retry",
+                headers={"Retry-After": "1"},
+            )
+        _password_stats["pending"] += 1
+    queued_at = time.monotonic()
+
+    def run():
+        waited = time.monotonic() - queued_at
+        with _password_lock:
+            _password_stats["wait_seconds_total"] += waited
+            _password_stats["wait_seconds_max"] = max(_password_stats["wait_seconds_max"], waited)
+        return fn(*args)
+
+    try:
+        return await asyncio.get_running_loop().run_in_executor(_password_executor, run)
+    finally:
+        with _password_lock:
+            _password_stats["pending"] -= 1
+            _password_stats["completed"] += 1
+
+
+async def hash_password_async(password: str) -> str:
+    """hash_password on the password pool, keeping the event loop free."""
+    return await _run_password_op(hash_password, password)
+
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """verify_password on the password pool, keeping the event loop free."""
+    return await _run_password_op(verify_password, plain_password, hashed_password)
+
+
+def password_pool_stats() -> dict:
+    """Queueing metrics of the password pool."""
+    with _password_lock:
+        stats = dict(_password_stats)
+    stats["avg_wait_seconds"] = round(stats["wait_seconds_total"] / stats["completed"], 4) if stats["completed"] else 0.0
+    stats.update(workers=BCRYPT_WORKERS, max_pending=BCRYPT_MAX_PENDING, rounds=BCRYPT_ROUNDS)
+    return stats
+
+
 def create_access_token(data: dict) -> str:
     """Create a JWT access token containing `data` and an exp claim."""
     to_encode = data.copy()
@@ -47,9 +121,43 @@ def create_access_token(data: dict) -> str:
     return encoded_jwt
 
 
+def token_claims(user: dict) -> dict:
+    """Claims identifying `user` in an access token: the email as subject plus the user id."""
+    return {"sub": user["email"], "uid": str(user["_id"])}
+
+
 # OAuth2 scheme for retrieving token from Authorization: Bearer <token>
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/login")
 
+# Cached user records: subject key -> (expiry on the monotonic clock, user record), in LRU order
+_user_cache: "OrderedDict[str, tuple[float, dict]]" = OrderedDict()
+
+
+def _cache_key(token_data: TokenData) -> str:
+    return f"uid:{token_data.user_id}" if token_data.user_id else f"email:{token_data.email}"
+
+
+def _cache_get(key: str):
+    entry = _user_cache.get(key)
+    if entry is None:
+        return None
+    expires_at, user = entry
+    if expires_at < time.monotonic():
+        del _user_cache[key]
+        return None
+    _user_cache.move_to_end(key)
+    # Callers get their own copy, so mutating it never changes the cached record
+    return copy.deepcopy(user)
+
+
+def _cache_put(key: str, user: dict):
+    if USER_CACHE_TTL_SECONDS <= 0 or USER_CACHE_MAX_ENTRIES <= 0:
+        return
+    _user_cache[key] = (time.monotonic() + USER_CACHE_TTL_SECONDS, copy.deepcopy(user))
+    _user_cache.move_to_end(key)
+    while len(_user_cache) > USER_CACHE_MAX_ENTRIES:
+        _user_cache.popitem(last=False)
+
 
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
@@ -61,11 +169,23 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
-        token_data = TokenData(email=email)
+        token_data = TokenData(email=email, user_id=payload.get("uid"))
     except JWTError:
         raise credentials_exception
 
-    user = await users_collection.find_one({"email": token_data.email})
+    key = _cache_key(token_data)
+    user = _cache_get(key)
+    if user is not None:
+        return user
+
+    if token_data.user_id:
+        # Tokens carrying the user id resolve with a GetItem instead of the email index
+        user = await users_collection.find_one({"_id": token_data.user_id})
+        if user is not None and user.get("email") != token_data.email:
+            user = None
+    else:
+        user = await users_collection.find_one({"email": token_data.email})
     if user is None:
         raise credentials_exception
+    _cache_put(key, user)
     return user
@@ -0,0 +1,349 @@
+import os
+import math
+import time
+import asyncio
+import hashlib
+import logging
+import tempfile
+import threading
+from contextlib import AsyncExitStack, asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, NamedTuple, Optional
+from dotenv import load_dotenv
+load_dotenv()  # Load environment variables from .env file
+import aioboto3
+from botocore.config import Config
+
+from backend.utils.pdf_parser import PdfSource, SpilledPdf
+
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+# Objects up to this size are downloaded straight into memory; larger ones go to a spill file.
+PDF_INMEMORY_MAX_BYTES = int(os.getenv("PDF_INMEMORY_MAX_BYTES", str(64 * 1024 * 1024)))
+# Directory for spill files (e.g. a tmpfs mount). Defaults to the system temp directory.
+PDF_SPILL_DIR = os.getenv("PDF_SPILL_DIR") or None
+S3_DOWNLOAD_CHUNK_BYTES = 1024 * 1024
+# HTTP connections kept open by the shared S3 client of each event loop.
+S3_MAX_POOL_CONNECTIONS = int(os.getenv("S3_MAX_POOL_CONNECTIONS", "50"))
+# Part size of multipart uploads (S3 minimum is 5 MiB); smaller files are sent with one PUT.
+S3_UPLOAD_PART_BYTES = max(int(os.getenv("S3_UPLOAD_PART_BYTES", str(8 * 1024 * 1024))), 5 * 1024 * 1024)
+# Parts of one upload in flight at once; memory per upload is about part size x this.
+S3_UPLOAD_CONCURRENCY = int(os.getenv("S3_UPLOAD_CONCURRENCY", "4"))
+# Lifetime of presigned upload URLs handed to clients.
+S3_PRESIGNED_URL_EXPIRES_SECONDS = int(os.getenv("S3_PRESIGNED_URL_EXPIRES_SECONDS", "3600"))
+# Largest file accepted through the presigned upload flow.
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", str(2 * 1024 * 1024 * 1024)))
+# Presigned multipart uploads still incomplete after this long are aborted (by default an
+# hour after their part URLs expired), so abandoned parts do not accumulate in the bucket.
+S3_STALE_UPLOAD_SECONDS = int(os.getenv("S3_STALE_UPLOAD_SECONDS", str(S3_PRESIGNED_URL_EXPIRES_SECONDS + 3600)))
+# S3 limit on the number of parts of a multipart upload.
+S3_MAX_PARTS = 10000
+
+
+def s3_client_kwargs() -> dict:
+    """Connection settings shared by every S3 client in the application."""
+    return dict(
+        region_name=os.getenv('AWS_REGION'),
+        aws_access_key_id=os.getenv('AWS_ACCESS_KEY_ID'),
+        aws_secret_access_key=os.getenv('AWS_SECRET_ACCESS_KEY'),
+        aws_session_token=os.getenv('AWS_SESSION_TOKEN'),
+        # S3-compatible endpoint (e.g. MinIO or LocalStack for local development)
+        endpoint_url=os.getenv('S3_ENDPOINT_URL') or None,
+    )
+
+
+class _SharedS3Client:
+    """One pooled aioboto3 S3 client per event loop, opened on first use.
+
+    Like the DynamoDB resource (backend.dynamodb_client), connections belong to the loop
+    they were opened on; close() is called from the application/worker shutdown hooks.
+    """
+
+    def __init__(self):
+        self._clients: Dict[asyncio.AbstractEventLoop, tuple] = {}
+        self._lock = threading.Lock()
+
+    async def get(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._clients.get(loop)
+            if entry is None:
+                entry = self._clients[loop] = (AsyncExitStack(), asyncio.Lock(), [])
+        stack, lock, holder = entry
+        if holder:
+            return holder[0]
+        async with lock:
+            if not holder:
+                # SigV4, so presigned URLs can sign the Content-Length of an upload
+                config = Config(max_pool_connections=S3_MAX_POOL_CONNECTIONS, signature_version="s3v4")
+                client = await stack.enter_async_context(
+                    aioboto3.Session().client('s3', config=config, **s3_client_kwargs())
+                )
+                holder.append(client)
+                logger.info("Opened S3 client (pool of %d connections)", S3_MAX_POOL_CONNECTIONS)
+        return holder[0]
+
+    async def close(self):
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._clients.pop(loop, None)
+        if entry is not None:
+            await entry[0].aclose()
+            logger.info("Closed S3 client")
+
+
+s3_clients = _SharedS3Client()
+
+
+async def get_s3_client():
+    """Return the shared S3 client of the running event loop."""
+    return await s3_clients.get()
+
+
+class UploadResult(NamedTuple):
+    size: int            # bytes uploaded
+    sha256: str          # hex SHA-256 of the uploaded bytes
+    parts: int           # multipart parts (0 for a single PUT)
+    seconds: float       # wall-clock duration of the upload
+
+    @property
+    def mb_per_second(self) -> float:
+        return self.size / (1024 * 1024) / self.seconds if self.seconds else 0.0
+
+
+async def upload_stream(source, s3_key: str, bucket_name: str | None = None,
+                        content_type: str = 'application/pdf') -> UploadResult:
+    """Upload a file-like object with an async `read(n)` (e.g. an UploadFile) to S3.
+
+    The source is read in S3_UPLOAD_PART_BYTES parts, so memory stays bounded whatever
+    the file size. A file that fits in one part is sent with a single PUT; anything larger
+    becomes a multipart upload with up to S3_UPLOAD_CONCURRENCY parts in flight, aborted
+    if any part fails. The SHA-256 of the content is computed on the way through.
+    """
+    bucket_name = bucket_name or os.getenv('AWS_S3_BUCKET_NAME')
+    if not bucket_name:
+        raise RuntimeError("AWS_S3_BUCKET_NAME not configured")
+
+    s3_client = await get_s3_client()
+    started = time.monotonic()
+    digest = hashlib.sha256()
+    first = await source.read(S3_UPLOAD_PART_BYTES)
+    digest.update(first)
+    second = await source.read(S3_UPLOAD_PART_BYTES) if len(first) == S3_UPLOAD_PART_BYTES else b""
+
+    if not second:
+        await s3_client.put_object(Bucket=bucket_name, Key=s3_key, Body=first, ContentType=content_type)
+        result = UploadResult(len(first), digest.hexdigest(), 0, time.monotonic() - started)
+    else:
+        upload = await s3_client.create_multipart_upload(Bucket=bucket_name, Key=s3_key, ContentType=content_type)
+        upload_id = upload['UploadId']
+        semaphore = asyncio.Semaphore(S3_UPLOAD_CONCURRENCY)
+        tasks = []
+        size = 0
+
+        async def put_part(number: int, body: bytes):
+            try:
+                resp = await s3_client.upload_part(
+                    Bucket=bucket_name, Key=s3_key, UploadId=upload_id, PartNumber=number, Body=body,
+                )
+                return {'PartNumber': number, 'ETag': resp['ETag']}
+            finally:
+                semaphore.release()
+
+        try:
+            part, number = first, 1
+            while part:
+                if number > 1:
+                    digest.update(part)
+                size += len(part)
+                # Wait for a free slot before reading further, so at most
+                # S3_UPLOAD_CONCURRENCY parts are held in memory
+                await semaphore.acquire()
+                failed = next((t for t in tasks if t.done() and not t.cancelled() and t.exception()), None)
+                if failed is not None:
+                    semaphore.release()
+                    raise failed.exception()
+                tasks.append(asyncio.create_task(put_part(number, part)))
+                if number == 1:
+                    part = second
+                else:
+                    part = await source.read(S3_UPLOAD_PART_BYTES)
+                number += 1
+            parts = await asyncio.gather(*tasks)
+            await s3_client.complete_multipart_upload(
+                Bucket=bucket_name, Key=s3_key, UploadId=upload_id, MultipartUpload={'Parts': parts},
+            )
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            try:
+                await s3_client.abort_multipart_upload(Bucket=bucket_name, Key=s3_key, UploadId=upload_id)
+            except Exception as abort_err:
+                logger.warning("Could not abort multipart upload of %s: %s", s3_key, abort_err)
+            raise
+        result = UploadResult(size, digest.hexdigest(), len(parts), time.monotonic() - started)
+
+    logger.info("Uploaded %s to S3: %d bytes in %.2fs (%.1f MB/s, %d parts)",
+                s3_key, result.size, result.seconds, result.mb_per_second, result.parts)
+    return result
+
+
+async def presign_upload(s3_key: str, size: int, content_type: str = 'application/pdf',
+                         bucket_name: str | None = None) -> Dict[str, Any]:
+    """Presigned URLs for uploading the `size` bytes of `s3_key` straight from the client to S3.
+
+    Files up to one S3_UPLOAD_PART_BYTES part get a single PUT URL (`method: "single"`).
+    Larger files get a multipart upload with one presigned URL per part
+    (`method: "multipart"`); the client PUTs each `part_size` slice to its URL and reports
+    the returned ETags so the upload can be completed (complete_multipart_upload).
+
+    Every URL signs the Content-Length of its body, so S3 rejects uploads of any other
+    size and a client cannot store more than it declared.
+    """
+    if size <= 0:
+        raise ValueError("Upload size must be positive")
+    bucket_name = bucket_name or os.getenv('AWS_S3_BUCKET_NAME')
+    if not bucket_name:
+        raise RuntimeError("AWS_S3_BUCKET_NAME not configured")
+    s3_client = await get_s3_client()
+
+    if size <= S3_UPLOAD_PART_BYTES:
+        url = await s3_client.generate_presigned_url(
+            'put_object',
+            Params={'Bucket': bucket_name, 'Key': s3_key, 'ContentType': content_type, 'ContentLength': size},
+            ExpiresIn=S3_PRESIGNED_URL_EXPIRES_SECONDS,
+        )
+        return {"method": "single", "url": url, "expires_in": S3_PRESIGNED_URL_EXPIRES_SECONDS}
+
+    part_size = max(S3_UPLOAD_PART_BYTES, math.ceil(size / S3_MAX_PARTS))
+    part_count = math.ceil(size / part_size)
+    upload = await s3_client.create_multipart_upload(Bucket=bucket_name, Key=s3_key, ContentType=content_type)
+    upload_id = upload['UploadId']
+    part_urls = []
+    for number in range(1, part_count + 1):
+        url = await s3_client.generate_presigned_url(
+            'upload_part',
+            Params={
+                'Bucket': bucket_name, 'Key': s3_key, 'UploadId': upload_id, 'PartNumber': number,
+                # Every part is full-sized except the last
+                'ContentLength': min(part_size, size - (number - 1) * part_size),
+            },
+            ExpiresIn=S3_PRESIGNED_URL_EXPIRES_SECONDS,
+        )
+        part_urls.append({"part_number": number, "url": url})
+    return {
+        "method": "multipart",
+        "upload_id": upload_id,
+        "part_size": part_size,
+        "part_urls": part_urls,
+        "expires_in": S3_PRESIGNED_URL_EXPIRES_SECONDS,
+    }
+
+
+async def complete_multipart_upload(s3_key: str, upload_id: str, parts: List[Dict[str, Any]],
+                                    bucket_name: str | None = None):
+    """Assemble a presigned multipart upload from its (part_number, etag) list."""
+    bucket_name = bucket_name or os.getenv('AWS_S3_BUCKET_NAME')
+    s3_client = await get_s3_client()
+    await s3_client.complete_multipart_upload(
+        Bucket=bucket_name,
+        Key=s3_key,
+        UploadId=upload_id,
+        MultipartUpload={'Parts': sorted(
+            ({'PartNumber': p['part_number'], 'ETag': p['etag']} for p in parts),
+            key=lambda p: p['PartNumber'],
+        )},
+    )
+
+
+async def abort_stale_multipart_uploads(max_age_seconds: int = S3_STALE_UPLOAD_SECONDS,
+                                        bucket_name: str | None = None) -> List[str]:
+    """Abort multipart uploads started more than `max_age_seconds` ago; returns their keys."""
+    bucket_name = bucket_name or os.getenv('AWS_S3_BUCKET_NAME')
+    if not bucket_name:
+        raise RuntimeError("AWS_S3_BUCKET_NAME not configured")
+    s3_client = await get_s3_client()
+    cutoff = time.time() - max_age_seconds
+    aborted = []
+    paginator = s3_client.get_paginator('list_multipart_uploads')
+    async for page in paginator.paginate(Bucket=bucket_name):
+        for upload in page.get('Uploads') or []:
+            if upload['Initiated'].timestamp() > cutoff:
+                continue
+            try:
+                await s3_client.abort_multipart_upload(Bucket=bucket_name, Key=upload['Key'], UploadId=upload['UploadId'])
+                aborted.append(upload['Key'])
+            except Exception as e:
+                logger.warning("Could not abort stale multipart upload of %s: %s", upload['Key'], e)
+    if aborted:
+        logger.info("Aborted %d stale multipart uploads", len(aborted))
+    return aborted
+
+
+async def head_upload(s3_key: str, bucket_name: str | None = None) -> Optional[Dict[str, Any]]:
+    """Metadata of an uploaded object (ContentLength, ContentType, ...), or None if it does not exist."""
+    bucket_name = bucket_name or os.getenv('AWS_S3_BUCKET_NAME')
+    s3_client = await get_s3_client()
+    try:
+        return await s3_client.head_object(Bucket=bucket_name, Key=s3_key)
+    except s3_client.exceptions.ClientError as e:
+        if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+            return None
+        raise
+
+
+@asynccontextmanager
+async def open_s3_pdf(s3_key: str, bucket_name: str | None = None) -> AsyncIterator[PdfSource]:
+    """Download a PDF from S3 and yield it as a PdfSource for extract_text_from_pdf.
+
+    Objects up to PDF_INMEMORY_MAX_BYTES are yielded as bytes. Larger objects are
+    streamed into an anonymous spill file (already unlinked, so nothing is left on disk
+    if the worker dies) and yielded as a memoryview over a read-only SpilledPdf mapping of
+    it, which extraction workers re-map from the file rather than copy.
+    """
+    bucket_name = bucket_name or os.getenv('AWS_S3_BUCKET_NAME')
+    if not bucket_name:
+        raise RuntimeError("AWS_S3_BUCKET_NAME not configured")
+
+    spill = None
+    data = None
+    s3_client = await get_s3_client()
+    logger.info("Downloading S3 object %s from bucket %s", s3_key, bucket_name)
+    response = await s3_client.get_object(Bucket=bucket_name, Key=s3_key)
+    size = response.get('ContentLength') or 0
+    if size <= PDF_INMEMORY_MAX_BYTES:
+        data = await response['Body'].read()
+        logger.info("Downloaded S3 object %s into memory (%d bytes)", s3_key, len(data))
+    else:
+        spill = tempfile.TemporaryFile(suffix='.pdf', dir=PDF_SPILL_DIR)
+        try:
+            async for chunk in response['Body'].iter_chunks(S3_DOWNLOAD_CHUNK_BYTES):
+                spill.write(chunk)
+            spill.flush()
+        except BaseException:
+            spill.close()
+            raise
+        logger.info("Downloaded S3 object %s into a spill file (%d bytes)", s3_key, size)
+
+    if spill is None:
+        yield data
+        return
+
+    mapped = None
+    view = None
+    try:
+        mapped = SpilledPdf(spill)
+        view = memoryview(mapped)
+        yield view
+    finally:
+        try:
+            if view is not None:
+                view.release()
+            if mapped is not None:
+                mapped.close()
+        except (BufferError, ValueError) as release_err:
+            # A PyMuPDF document may still reference the buffer; the mapping is freed with it
+            logger.debug("Deferred release of spill mapping for %s: %s", s3_key, release_err)
+        spill.close()
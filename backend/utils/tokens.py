@@ -0,0 +1,21 @@
+import re
+from typing import List
+
+# A cheap, dependency-free approximation of LLM/embedding tokens: every word and
+# every punctuation mark counts as one token. It slightly under-counts compared
+# to BPE tokenizers, so budgets built on it should leave some headroom.
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]", re.UNICODE)
+
+
+def tokenize(text: str) -> List[re.Match]:
+    """Return the token matches of `text` (use .start()/.end() to slice the original string)."""
+    if not text:
+        return []
+    return list(_TOKEN_RE.finditer(text))
+
+
+def count_tokens(text: str) -> int:
+    """Approximate the number of tokens in `text`."""
+    if not text:
+        return 0
+    return sum(1 for _ in _TOKEN_RE.finditer(text))